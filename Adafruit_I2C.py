@@ -1,6 +1,260 @@
 #!/usr/bin/python
 import re
-import smbus
+import sys
+import time
+import array
+import struct
+import threading
+try:
+  import smbus
+except ImportError:
+  # off the Pi, install a simulated backend with Adafruit_I2C.setBackend
+  smbus = None
+
+# SMBus factory, smbus.SMBus unless replaced by Adafruit_I2C.setBackend
+smbusFactory = None
+
+# (big, little) endian structs of the byte counts reverseByteOrder
+# swaps in one go
+_SWAP = dict((size, (struct.Struct('>' + fmt), struct.Struct('<' + fmt)))
+             for size, fmt in ((1, 'B'), (2, 'H'), (4, 'I'), (8, 'Q')))
+
+# ===========================================================================
+# I2CError and RetryPolicy Classes
+# ===========================================================================
+
+class I2CError(IOError):
+  """A transaction that still failed after every attempt of the
+  RetryPolicy, errno is that of the last smbus IOError"""
+
+  def __init__(self, address, reg, attempts, err):
+    IOError.__init__(self, err.errno, "0x%02X reg %s: %s after %d attempts" %
+                     (address, "-" if reg is None else "0x%02X" % reg,
+                      err.strerror or err, attempts))
+    self.address = address
+    self.reg = reg
+    self.attempts = attempts
+
+class RetryPolicy(object):
+  """How a failed transaction is retried: up to attempts tries in all,
+  sleeping delay before the first retry, multiplied by backoff before
+  each next one up to maxDelay, and with reopen the SMBus handle is
+  reopened before the last try. A reopen only gets a new file
+  descriptor, it does not reset the adapter or free a slave holding
+  SDA low, that takes clocking SCL by hand or a power cycle"""
+
+  def __init__(self, attempts=3, delay=0.0005, backoff=2.0, maxDelay=0.01,
+               reopen=True):
+    if attempts < 1:
+      raise ValueError("at least one attempt")
+    self.attempts = attempts
+    self.delay = delay
+    self.backoff = backoff
+    self.maxDelay = maxDelay
+    self.reopen = reopen
+
+# a single attempt, for transfers that must not be repeated: a FIFO
+# read that failed may already have popped its bytes, a block write
+# may already have pushed some of its data
+NO_RETRY = RetryPolicy(attempts=1)
+
+# ===========================================================================
+# I2CStats Class
+# ===========================================================================
+
+class I2CStats(object):
+  """Transaction counters of one bus, keyed by (address, register),
+  register None for the register-less write_byte/read_byte.
+  Each entry is [count, bytes, errors, retries, total seconds,
+  histogram], the histogram counts transactions per power of two
+  microseconds: bucket n holds latencies below 2**n us.
+  Updated under the bus lock, read with snapshot() or report()"""
+
+  BUCKETS = 21  # up to 2**20 us, about a second
+
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    self.entries = {}
+    self.start = time.time()
+
+  def _entry(self, addr, reg):
+    entry = self.entries.get((addr, reg))
+    if entry is None:
+      entry = self.entries[(addr, reg)] = [0, 0, 0, 0, 0.0, [0] * self.BUCKETS]
+    return entry
+
+  def record(self, addr, reg, nbytes, seconds):
+    entry = self._entry(addr, reg)
+    entry[0] += 1
+    entry[1] += nbytes
+    entry[4] += seconds
+    bucket = int(seconds * 1e6).bit_length()
+    entry[5][min(bucket, self.BUCKETS - 1)] += 1
+
+  def error(self, addr, reg):
+    self._entry(addr, reg)[2] += 1
+
+  def retry(self, addr, reg):
+    self._entry(addr, reg)[3] += 1
+
+  def snapshot(self):
+    "Copy of the entries, safe to read while the bus is in use"
+    return dict((key, entry[:5] + [entry[5][:]])
+                for key, entry in self.entries.items())
+
+  @staticmethod
+  def percentile(histogram, fraction):
+    "Upper bound in us of the bucket holding the fraction-th transaction"
+    target = fraction * sum(histogram)
+    count = 0
+    for bucket, n in enumerate(histogram):
+      count += n
+      if n and count >= target:
+        return 1 << bucket
+    return 0
+
+  def report(self):
+    "One line per address and register since the last reset"
+    elapsed = time.time() - self.start
+    lines = ["%-6s %-5s %9s %9s %7s %7s %9s %9s %9s" %
+             ("addr", "reg", "trans", "bytes", "errors", "retries",
+              "mean us", "p50 us<", "p99 us<")]
+    entries = self.snapshot()
+    for (addr, reg) in sorted(entries):
+      count, nbytes, errors, retries, total, histogram = entries[(addr, reg)]
+      lines.append("0x%02X   %-5s %9d %9d %7d %7d %9.0f %9d %9d" % (
+        addr, "-" if reg is None else "0x%02X" % reg, count, nbytes,
+        errors, retries, 1e6 * total / count if count else 0.0,
+        self.percentile(histogram, 0.5), self.percentile(histogram, 0.99)))
+    lines.append("%.1f s" % elapsed)
+    return "\n".join(lines)
+
+# ===========================================================================
+# I2CBus Class
+# ===========================================================================
+
+class I2CBus(object):
+  """An SMBus handle shared by every device on /dev/i2c-N.
+  Each transaction holds the bus lock, a multi-byte sequence to one
+  device holds that device's lock (see Adafruit_I2C.transaction).
+  With stats enabled every transaction is timed into an I2CStats,
+  disabled it costs one attribute test"""
+
+  def __init__(self, busnum):
+    self.busnum = busnum
+    backend = smbusFactory
+    if backend is None:
+      if smbus is None:
+        raise IOError("smbus not installed, no backend for /dev/i2c-%d" % busnum)
+      backend = smbus.SMBus
+    self.backend = backend
+    self.smbus = backend(busnum)
+    self.reopens = 0
+    # transactions never nest, a plain Lock is cheaper than an RLock
+    self.lock = threading.Lock()
+    self.deviceLocks = {}
+    self.stats = None
+
+  def enableStats(self):
+    "Starts timing transactions, returns the bus I2CStats"
+    if self.stats is None:
+      self.stats = I2CStats()
+    return self.stats
+
+  def disableStats(self):
+    self.stats = None
+
+  def deviceLock(self, address):
+    "Returns the re-entrant lock of one device address on this bus"
+    with self.lock:
+      return self.deviceLocks.setdefault(address, threading.RLock())
+
+  def close(self):
+    with self.lock:
+      self.smbus.close()
+
+  def reopen(self):
+    """Closes and reopens the SMBus handle after repeated errors,
+    a new file descriptor only, a stuck slave stays stuck"""
+    with self.lock:
+      try:
+        self.smbus.close()
+      except IOError:
+        pass
+      self.smbus = self.backend(self.busnum)
+      self.reopens += 1
+
+  def countRetry(self, addr, reg):
+    with self.lock:
+      if self.stats is not None:
+        self.stats.retry(addr, reg)
+
+  def _timed(self, stats, addr, reg, nbytes, func, *args):
+    # bus lock held, the IOError is counted and passed on
+    tic = time.time()
+    try:
+      result = func(addr, *args)
+    except IOError:
+      stats.error(addr, reg)
+      raise
+    stats.record(addr, reg, nbytes, time.time() - tic)
+    return result
+
+  def write_byte(self, addr, value):
+    with self.lock:
+      if self.stats is None:
+        return self.smbus.write_byte(addr, value)
+      return self._timed(self.stats, addr, None, 1, self.smbus.write_byte, value)
+
+  def read_byte(self, addr):
+    with self.lock:
+      if self.stats is None:
+        return self.smbus.read_byte(addr)
+      return self._timed(self.stats, addr, None, 1, self.smbus.read_byte)
+
+  def write_byte_data(self, addr, reg, value):
+    with self.lock:
+      if self.stats is None:
+        return self.smbus.write_byte_data(addr, reg, value)
+      return self._timed(self.stats, addr, reg, 1,
+                         self.smbus.write_byte_data, reg, value)
+
+  def read_byte_data(self, addr, reg):
+    with self.lock:
+      if self.stats is None:
+        return self.smbus.read_byte_data(addr, reg)
+      return self._timed(self.stats, addr, reg, 1,
+                         self.smbus.read_byte_data, reg)
+
+  def write_word_data(self, addr, reg, value):
+    with self.lock:
+      if self.stats is None:
+        return self.smbus.write_word_data(addr, reg, value)
+      return self._timed(self.stats, addr, reg, 2,
+                         self.smbus.write_word_data, reg, value)
+
+  def read_word_data(self, addr, reg):
+    with self.lock:
+      if self.stats is None:
+        return self.smbus.read_word_data(addr, reg)
+      return self._timed(self.stats, addr, reg, 2,
+                         self.smbus.read_word_data, reg)
+
+  def write_i2c_block_data(self, addr, reg, data):
+    with self.lock:
+      if self.stats is None:
+        return self.smbus.write_i2c_block_data(addr, reg, data)
+      return self._timed(self.stats, addr, reg, len(data),
+                         self.smbus.write_i2c_block_data, reg, data)
+
+  def read_i2c_block_data(self, addr, reg, length):
+    with self.lock:
+      if self.stats is None:
+        return self.smbus.read_i2c_block_data(addr, reg, length)
+      return self._timed(self.stats, addr, reg, length,
+                         self.smbus.read_i2c_block_data, reg, length)
 
 # ===========================================================================
 # Adafruit_I2C Class
@@ -8,6 +262,21 @@ import smbus
 
 class Adafruit_I2C(object):
 
+  # process-wide I2CBus registry, keyed by bus number
+  _buses = {}
+  _busesLock = threading.Lock()
+  _piBusNumber = None
+
+  # shared by every device unless one is given its own
+  retryPolicy = RetryPolicy()
+  # True (since the retries): raise I2CError once the retries are used
+  # up, callers that tested for -1 must catch I2CError instead,
+  # False: print and return -1 as before
+  raiseErrors = True
+  # True: every bus times its transactions from when it is opened,
+  # without opening any bus before a device uses it
+  statsOnOpen = False
+
   @staticmethod
   def getPiRevision():
     "Gets the version number of the Raspberry Pi board"
@@ -31,118 +300,239 @@ class Adafruit_I2C(object):
 
   @staticmethod
   def getPiI2CBusNumber():
-    # Gets the I2C bus number /dev/i2c#
-    return 1 if Adafruit_I2C.getPiRevision() > 1 else 0
+    # Gets the I2C bus number /dev/i2c#, /proc/cpuinfo is only read once
+    if Adafruit_I2C._piBusNumber is None:
+      Adafruit_I2C._piBusNumber = 1 if Adafruit_I2C.getPiRevision() > 1 else 0
+    return Adafruit_I2C._piBusNumber
+
+  @staticmethod
+  def getBus(busnum=-1):
+    "Returns the shared I2CBus of /dev/i2c-busnum, opened on first use"
+    if busnum < 0:
+      busnum = Adafruit_I2C.getPiI2CBusNumber()
+    with Adafruit_I2C._busesLock:
+      bus = Adafruit_I2C._buses.get(busnum)
+      if bus is None:
+        bus = Adafruit_I2C._buses[busnum] = I2CBus(busnum)
+        if Adafruit_I2C.statsOnOpen:
+          bus.enableStats()
+      return bus
+
+  @staticmethod
+  def closeBus(busnum=-1):
+    "Closes a shared I2CBus, the next getBus opens it again"
+    if busnum < 0:
+      busnum = Adafruit_I2C.getPiI2CBusNumber()
+    with Adafruit_I2C._busesLock:
+      bus = Adafruit_I2C._buses.pop(busnum, None)
+    if bus is not None:
+      bus.close()
+
+  @staticmethod
+  def setBackend(factory):
+    """Opens buses with factory(busnum) instead of smbus.SMBus, e.g. a
+    simulated bus (see I2C_sim), None goes back to smbus.SMBus.
+    Buses already open are closed so devices created later use it"""
+    global smbusFactory
+    with Adafruit_I2C._busesLock:
+      buses = Adafruit_I2C._buses.values()
+      Adafruit_I2C._buses.clear()
+      smbusFactory = factory
+    for bus in buses:
+      bus.close()
+
+  @staticmethod
+  def enableStats(busnum=-1):
+    """Times the transactions of a shared bus, returns its I2CStats,
+    opens the bus, see statsOnOpen to time buses as they are opened"""
+    return Adafruit_I2C.getBus(busnum).enableStats()
+
+  @staticmethod
+  def statsReport():
+    """Reports of every open bus with stats enabled, takes the bus
+    registry lock: not from a signal handler, which may have
+    interrupted a thread holding it"""
+    with Adafruit_I2C._busesLock:
+      buses = sorted(Adafruit_I2C._buses.items())
+    return "\n".join("/dev/i2c-%d\n%s" % (busnum, bus.stats.report())
+                     for busnum, bus in buses if bus.stats is not None)
 
   def __init__(self, address, busnum=-1, debug=False):
     self.address = address
     # By default, the correct I2C bus is auto-detected using /proc/cpuinfo
     # Alternatively, you can hard-code the bus version below:
-    # self.bus = smbus.SMBus(0); # Force I2C0 (early 256MB Pi's)
-    # self.bus = smbus.SMBus(1); # Force I2C1 (512MB Pi's)
-    self.bus = smbus.SMBus(busnum if busnum >= 0 else Adafruit_I2C.getPiI2CBusNumber())
+    # self.bus = Adafruit_I2C.getBus(0); # Force I2C0 (early 256MB Pi's)
+    # self.bus = Adafruit_I2C.getBus(1); # Force I2C1 (512MB Pi's)
+    # Devices on the same bus share one handle, opened on first use
+    self.busnum = busnum
     self.debug = debug
 
+  def __getattr__(self, name):
+    # only called while self.bus is unset, the first access opens
+    # the shared bus and stores it, later accesses cost nothing
+    if name == 'bus':
+      self.bus = Adafruit_I2C.getBus(self.busnum)
+      return self.bus
+    raise AttributeError("'%s' object has no attribute '%s'" %
+                         (type(self).__name__, name))
+
+  def transaction(self):
+    """Lock for a multi-byte sequence to this device:
+      with self.transaction():
+        ...
+    other devices can still use the bus between its transactions"""
+    return self.bus.deviceLock(self.address)
+
   def reverseByteOrder(self, data):
     "Reverses the byte order of an int (16-bit) or long (32-bit) value"
-    # Courtesy Vishal Sapre
-    byteCount = len(hex(data)[2:].replace('L','')[::2])
-    val       = 0
-    for i in range(byteCount):
-      val    = (val << 8) | (data & 0xff)
-      data >>= 8
-    return val
-
-  def errMsg(self):
+    byteCount = max((data.bit_length() + 7) // 8, 1)
+    swap = _SWAP.get(byteCount)
+    if swap is not None:
+      return swap[1].unpack(swap[0].pack(data))[0]
+    # odd sizes, through the hex digits
+    return int(('%0*x' % (2 * byteCount, data)).decode('hex')[::-1].encode('hex'), 16)
+
+  def _transfer(self, reg, func, *args, **kwargs):
+    """Calls func(address, *args), retried under the retry policy,
+    tried once with retry=False"""
+    policy = self.retryPolicy if kwargs.get('retry', True) else NO_RETRY
+    try:
+      return func(self.address, *args)
+    except IOError, err:
+      pass
+    delay = policy.delay
+    for attempt in range(2, policy.attempts + 1):
+      self.bus.countRetry(self.address, reg)
+      time.sleep(delay)
+      delay = min(delay * policy.backoff, policy.maxDelay)
+      if policy.reopen and attempt == policy.attempts:
+        self.bus.reopen()
+      try:
+        return func(self.address, *args)
+      except IOError, err:
+        pass
+    raise I2CError(self.address, reg, policy.attempts, err)
+
+  def errMsg(self, err=None):
+    "Raises err, or prints and returns -1 if raiseErrors is off"
+    if err is not None and self.raiseErrors:
+      raise err
     print "Error accessing 0x%02X: Check your I2C address" % self.address
     return -1
 
-  def write8(self, reg, value):
+  def write8(self, reg, value, retry=True):
     "Writes an 8-bit value to the specified register/address"
     try:
-      self.bus.write_byte_data(self.address, reg, value)
+      self._transfer(reg, self.bus.write_byte_data, reg, value, retry=retry)
       if self.debug:
         print "I2C: Wrote 0x%02X to register 0x%02X" % (value, reg)
     except IOError, err:
-      return self.errMsg()
+      return self.errMsg(err)
 
   def write16(self, reg, value):
     "Writes a 16-bit value to the specified register/address pair"
     try:
-      self.bus.write_word_data(self.address, reg, value)
+      self._transfer(reg, self.bus.write_word_data, reg, value)
       if self.debug:
         print ("I2C: Wrote 0x%02X to register pair 0x%02X,0x%02X" %
          (value, reg, reg+1))
     except IOError, err:
-      return self.errMsg()
+      return self.errMsg(err)
 
   def writeRaw8(self, value):
     "Writes an 8-bit value on the bus"
     try:
-      self.bus.write_byte(self.address, value)
+      self._transfer(None, self.bus.write_byte, value)
       if self.debug:
         print "I2C: Wrote 0x%02X" % value
     except IOError, err:
-      return self.errMsg()
+      return self.errMsg(err)
+
+  def writeRawList(self, data, retry=True):
+    """Writes a sequence of bytes on the bus, without a register, for
+    port expanders (e.g. PCF8574) that latch every byte they receive.
+    One block write per 33 bytes, the SMBus command byte is the first"""
+    try:
+      for start in range(0, len(data), 33):
+        chunk = data[start:start + 33]
+        if len(chunk) == 1:
+          self._transfer(None, self.bus.write_byte, chunk[0], retry=retry)
+        else:
+          self._transfer(None, self.bus.write_i2c_block_data, chunk[0],
+                         list(chunk[1:]), retry=retry)
+      if self.debug:
+        print "I2C: Wrote %d bytes" % len(data)
+    except IOError, err:
+      return self.errMsg(err)
 
-  def writeList(self, reg, list):
+  def readRaw8(self):
+    "Reads an 8-bit value on the bus, without a register"
+    try:
+      result = self._transfer(None, self.bus.read_byte)
+      if self.debug:
+        print "I2C: Device 0x%02X returned 0x%02X" % (self.address, result & 0xFF)
+      return result
+    except IOError, err:
+      return self.errMsg(err)
+
+  def writeList(self, reg, list, retry=True):
     "Writes an array of bytes using I2C format"
     try:
       if self.debug:
         print "I2C: Writing list to register 0x%02X:" % reg
         print list
-      self.bus.write_i2c_block_data(self.address, reg, list)
+      self._transfer(reg, self.bus.write_i2c_block_data, reg, list, retry=retry)
     except IOError, err:
-      return self.errMsg()
+      return self.errMsg(err)
 
-  def readList(self, reg, length):
+  def readList(self, reg, length, retry=True):
     "Read a list of bytes from the I2C device"
     try:
-      results = self.bus.read_i2c_block_data(self.address, reg, length)
+      results = self._transfer(reg, self.bus.read_i2c_block_data, reg, length, retry=retry)
       if self.debug:
         print ("I2C: Device 0x%02X returned the following from reg 0x%02X" %
          (self.address, reg))
         print results
       return results
     except IOError, err:
-      return self.errMsg()
+      return self.errMsg(err)
 
-  def readU8(self, reg):
+  def readU8(self, reg, retry=True):
     "Read an unsigned byte from the I2C device"
     try:
-      result = self.bus.read_byte_data(self.address, reg)
+      result = self._transfer(reg, self.bus.read_byte_data, reg, retry=retry)
       if self.debug:
         print ("I2C: Device 0x%02X returned 0x%02X from reg 0x%02X" %
          (self.address, result & 0xFF, reg))
       return result
     except IOError, err:
-      return self.errMsg()
+      return self.errMsg(err)
 
   def readS8(self, reg):
     "Reads a signed byte from the I2C device"
     try:
-      result = self.bus.read_byte_data(self.address, reg)
+      result = self._transfer(reg, self.bus.read_byte_data, reg)
       if result > 127: result -= 256
       if self.debug:
         print ("I2C: Device 0x%02X returned 0x%02X from reg 0x%02X" %
          (self.address, result & 0xFF, reg))
       return result
     except IOError, err:
-      return self.errMsg()
+      return self.errMsg(err)
 
   def readU16(self, reg, little_endian=True):
     "Reads an unsigned 16-bit value from the I2C device"
     try:
-      result = self.bus.read_word_data(self.address,reg)
+      result = self._transfer(reg, self.bus.read_word_data, reg)
       # Swap bytes if using big endian because read_word_data assumes little 
       # endian on ARM (little endian) systems.
       if not little_endian:
-        result = ((result << 8) & 0xFF00) + (result >> 8)
+        result = ((result << 8) & 0xFF00) | (result >> 8)
       if (self.debug):
         print "I2C: Device 0x%02X returned 0x%04X from reg 0x%02X" % (self.address, result & 0xFFFF, reg)
       return result
     except IOError, err:
-      return self.errMsg()
+      return self.errMsg(err)
 
   def readS16(self, reg, little_endian=True):
     "Reads a signed 16-bit value from the I2C device"
@@ -151,7 +541,36 @@ class Adafruit_I2C(object):
       if result > 32767: result -= 65536
       return result
     except IOError, err:
-      return self.errMsg()
+      return self.errMsg(err)
+
+  def readBlock(self, reg, length):
+    """Reads length consecutive registers into a bytearray, one block
+    read per 32 bytes. Devices that need an auto-increment flag in the
+    register address (e.g. reg | 0x80 on ST sensors) get it in reg"""
+    try:
+      data = bytearray()
+      while length > 0:
+        count = min(length, 32)
+        data.extend(self._transfer(reg, self.bus.read_i2c_block_data, reg, count))
+        reg += count
+        length -= count
+      return data
+    except IOError, err:
+      return self.errMsg(err)
+
+  def readArray(self, reg, count, typecode='h', little_endian=True):
+    """Reads count values of an array typecode (e.g. 'h' int16, 'H'
+    uint16) from consecutive registers in one block read, decoded
+    without a Python loop per value, e.g. the x, y, z of a 6-axis
+    sample: readArray(OUT_X_L | 0x80, 6)"""
+    values = array.array(typecode)
+    data = self.readBlock(reg, count * values.itemsize)
+    if data == -1:
+      return data
+    values.fromstring(str(data))
+    if little_endian != (sys.byteorder == 'little'):
+      values.byteswap()
+    return values
 
 if __name__ == '__main__':
   try:
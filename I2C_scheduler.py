@@ -0,0 +1,192 @@
+#! /usr/bin/python
+""" priority-aware I2C transaction scheduler,
+the devices on one bus queue for it, when the bus frees up the waiting
+transaction with the highest priority goes next (earliest deadline
+first within a priority), so a rudder command never waits behind
+a whole LCD line, only behind the one transaction on the bus
+
+    scheduler = I2CScheduler()
+    scheduler.attach(pwm.i2c, ACTUATOR, deadline=0.002)
+    scheduler.attach(LCD, LCD_PRIORITY)
+    ...
+    print scheduler.report()
+"""
+
+import copy
+import heapq
+import itertools
+import threading
+import time
+
+# priorities, lower goes first
+ACTUATOR = 0
+IMU = 1
+GPS = 2
+LCD = 3
+
+INFINITY = float('inf')
+
+
+class DeviceBudget(object):
+    """ bus time bookkeeping of one device """
+
+    def __init__(self, name, budget=None):
+        self.name = name
+        self.budget = budget  # share of bus time, e.g. 0.1
+        self.count = 0
+        self.busy = 0.0
+        self.wait = 0.0
+        self.max_wait = 0.0
+        self.late = 0
+
+
+class I2CScheduler(object):
+    """ arbitrates one bus between prioritised devices,
+    an idle bus is taken at once, otherwise the caller waits in a heap
+    of (priority, deadline, sequence) and the releasing transaction
+    hands the bus straight to the head of the heap """
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._busy = False
+        self._waiting = []
+        self._sequence = itertools.count()
+        self.devices = {}
+        self.start = time.time()
+
+    def acquire(self, priority, deadline=INFINITY):
+        """ wait for the bus, deadline is an absolute time.time() """
+        with self._mutex:
+            if not self._busy:
+                self._busy = True
+                return
+            event = threading.Event()
+            heapq.heappush(self._waiting,
+                           (priority, deadline, next(self._sequence), event))
+        # the bus is ours once release sets the event
+        event.wait()
+
+    def release(self):
+        with self._mutex:
+            if self._waiting:
+                heapq.heappop(self._waiting)[3].set()
+            else:
+                self._busy = False
+
+    def run(self, device, priority, deadline, func, *args):
+        """ run func(*args) as one transaction of device,
+        deadline in seconds from now or None """
+        queued = time.time()
+        due = queued + deadline if deadline is not None else INFINITY
+        self.acquire(priority, due)
+        started = time.time()
+        try:
+            return func(*args)
+        finally:
+            finished = time.time()
+            self.release()
+            self._account(device, queued, started, finished, due)
+
+    def _account(self, device, queued, started, finished, due):
+        # under the mutex, the threads of one device finish concurrently
+        # and report reads the budgets from another thread
+        wait = started - queued
+        with self._mutex:
+            budget = self.devices.get(device)
+            if budget is None:
+                budget = self.devices[device] = DeviceBudget(device)
+            budget.count += 1
+            budget.busy += finished - started
+            budget.wait += wait
+            if wait > budget.max_wait:
+                budget.max_wait = wait
+            if finished > due:
+                budget.late += 1
+
+    def set_budget(self, device, share):
+        """ expected share of bus time of a device, flagged in report """
+        with self._mutex:
+            budget = self.devices.setdefault(device, DeviceBudget(device))
+            budget.budget = share
+
+    def attach(self, i2c, priority, deadline=None, name=None):
+        """ route the transactions of an Adafruit_I2C device through
+        the scheduler, returns the device name used in report """
+        name = name or "0x%02X" % i2c.address
+        i2c.bus = ScheduledBus(i2c.bus, self, name, priority, deadline)
+        with self._mutex:
+            self.devices.setdefault(name, DeviceBudget(name))
+        return name
+
+    def reset(self):
+        """ restart the bookkeeping, budgets are kept """
+        with self._mutex:
+            for name, budget in self.devices.items():
+                self.devices[name] = DeviceBudget(name, budget.budget)
+            self.start = time.time()
+
+    def report(self):
+        """ per device transactions, bus time and waits since reset """
+        with self._mutex:
+            devices = dict((name, copy.copy(budget))
+                           for name, budget in self.devices.items())
+            elapsed = time.time() - self.start
+        lines = ["%-10s %8s %10s %8s %8s %10s %10s %6s" %
+                 ("device", "trans", "bus ms/s", "share", "budget",
+                  "wait us", "max us", "late")]
+        for name in sorted(devices):
+            budget = devices[name]
+            share = budget.busy / elapsed if elapsed > 0 else 0.0
+            over = budget.budget is not None and share > budget.budget
+            lines.append("%-10s %8d %10.2f %7.1f%% %8s %10.0f %10.0f %6d%s" % (
+                name, budget.count, 1e3 * share, 100 * share,
+                "-" if budget.budget is None else "%.1f%%" % (100 * budget.budget),
+                1e6 * budget.wait / budget.count if budget.count else 0.0,
+                1e6 * budget.max_wait, budget.late,
+                " over budget" if over else ""))
+        return "\n".join(lines)
+
+
+class ScheduledBus(object):
+    """ stands in for an I2CBus, every transaction of one device
+    goes through the scheduler with that device's priority """
+
+    def __init__(self, bus, scheduler, name, priority, deadline=None):
+        self.bus = bus
+        self.scheduler = scheduler
+        self.name = name
+        self.priority = priority
+        self.deadline = deadline
+
+    def __getattr__(self, attr):
+        # busnum, deviceLock, close, ...
+        return getattr(self.bus, attr)
+
+    def _run(self, func, *args):
+        return self.scheduler.run(self.name, self.priority, self.deadline,
+                                  func, *args)
+
+    def write_byte(self, addr, value):
+        return self._run(self.bus.write_byte, addr, value)
+
+    def read_byte(self, addr):
+        return self._run(self.bus.read_byte, addr)
+
+    def write_byte_data(self, addr, reg, value):
+        return self._run(self.bus.write_byte_data, addr, reg, value)
+
+    def read_byte_data(self, addr, reg):
+        return self._run(self.bus.read_byte_data, addr, reg)
+
+    def write_word_data(self, addr, reg, value):
+        return self._run(self.bus.write_word_data, addr, reg, value)
+
+    def read_word_data(self, addr, reg):
+        return self._run(self.bus.read_word_data, addr, reg)
+
+    def write_i2c_block_data(self, addr, reg, data):
+        return self._run(self.bus.write_i2c_block_data, addr, reg, data)
+
+    def read_i2c_block_data(self, addr, reg, length):
+        return self._run(self.bus.read_i2c_block_data, addr, reg, length)
+
@@ -0,0 +1,571 @@
+#! /usr/bin/python
+""" simulated smbus backend for runs and benchmarks without /dev/i2c-N,
+SimSMBus stands in for smbus.SMBus and dispatches every transaction
+to a register-level model of the device at that address:
+    SC16IS750Model   UART bridge, RX FIFO fed from an NMEA file
+    PCA9685Model     PWM register map with MODE1 auto-increment
+    PCF8574LCDModel  HD44780 LCD behind a PCF8574 backpack
+    RegisterModel    plain 256 register device
+transactions and wire bytes are counted per address, a fixed
+latency per transaction and transfer errors can be injected
+
+    import I2C_sim
+    bus = I2C_sim.install()
+    bus.attach(0x48, I2C_sim.SC16IS750Model('tests/nmea_sample.nmea'))
+    GPS = GPS_I2C(0x48, busnum=1)
+"""
+
+import os
+import time
+import random
+import collections
+import nmea0183
+from Adafruit_I2C import Adafruit_I2C
+
+# NACK of a missing device, as the i2c-dev driver reports it
+EREMOTEIO = 121
+
+
+class SimSMBus(object):
+    """ smbus.SMBus stand-in, devices are attached by address,
+    latency: seconds slept per transaction,
+    scl: clock used to model bus_time from the bytes on the wire,
+    faults: fail_next, fail_rate and stuck make transactions raise
+    IOError like a NACK or a slave holding SDA low, a stuck bus
+    stays stuck through closing and reopening the handle, as on
+    i2c-dev, until unstick (the slave clocked free or power cycled),
+    a late fault is reported after the device handled the transaction
+    (a FIFO read popped its bytes, a block write latched part of its
+    data), as when the error hits a data ACK or the STOP """
+
+    def __init__(self, busnum=1, latency=0.0, scl=100e3):
+        self.busnum = busnum
+        self.latency = latency
+        self.scl = scl
+        self.devices = {}
+        self.failures = []
+        self.rate = None
+        self.stuck = None
+        self.late = None
+        # where late faults cut block writes short
+        self.cut = random.Random(0)
+        self.closes = 0
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.bus_time = 0.0
+        # address -> [transactions, bytes on the wire]
+        self.per_device = collections.defaultdict(lambda: [0, 0])
+
+    def attach(self, address, model):
+        self.devices[address] = model
+        return model
+
+    def _count(self, addr, nbytes):
+        self.transactions += 1
+        # 9 clocks per byte, address byte(s) included in nbytes
+        self.bus_time += nbytes * 9 / self.scl
+        count = self.per_device[addr]
+        count[0] += 1
+        count[1] += nbytes
+        if self.latency:
+            time.sleep(self.latency)
+
+    def fail_next(self, count=1, addr=None, errno=EREMOTEIO, late=False):
+        """ the next count transactions to addr (any if None) fail """
+        self.failures.append([addr, count, errno, late])
+
+    def fail_rate(self, rate, addr=None, errno=EREMOTEIO, seed=None, late=False):
+        """ transactions to addr (any if None) fail with probability
+        rate, 0 stops it """
+        self.rate = (rate, addr, errno, late) if rate else None
+        self.random = random.Random(seed)
+
+    def stick(self, errno=EREMOTEIO):
+        """ every transaction fails until unstick """
+        self.stuck = errno
+
+    def unstick(self):
+        self.stuck = None
+
+    def _fault(self, addr):
+        """ (errno, late) of an injected failure of this transaction,
+        or (None, False) """
+        if self.stuck is not None:
+            return self.stuck, False
+        for failure in self.failures:
+            if failure[0] in (None, addr):
+                failure[1] -= 1
+                if failure[1] <= 0:
+                    self.failures.remove(failure)
+                return failure[2], failure[3]
+        if self.rate is not None:
+            rate, rate_addr, errno, late = self.rate
+            if rate_addr in (None, addr) and self.random.random() < rate:
+                return errno, late
+        return None, False
+
+    def _device(self, addr, nbytes):
+        self._count(addr, nbytes)
+        if self.failures or self.rate or self.stuck is not None:
+            errno, late = self._fault(addr)
+            if late:
+                # raised by _done once the device has handled it
+                self.late = errno
+            elif errno is not None:
+                raise IOError(errno, os.strerror(errno))
+        try:
+            return self.devices[addr]
+        except KeyError:
+            self.late = None
+            raise IOError(EREMOTEIO, os.strerror(EREMOTEIO))
+
+    def _done(self, result=None):
+        errno, self.late = self.late, None
+        if errno is not None:
+            raise IOError(errno, os.strerror(errno))
+        return result
+
+    def close(self):
+        self.closes += 1
+
+    def write_byte(self, addr, value):
+        if addr == 0x00 and addr not in self.devices:
+            # general call, SWRST resets every attached device
+            self._count(addr, 2)
+            if value == 0x06:
+                for model in self.devices.values():
+                    model.reset()
+            return
+        self._done(self._device(addr, 2).write_byte(value))
+
+    def read_byte(self, addr):
+        return self._done(self._device(addr, 2).read_byte())
+
+    def write_byte_data(self, addr, reg, value):
+        self._done(self._device(addr, 3).write_block(reg, [value]))
+
+    def read_byte_data(self, addr, reg):
+        return self._done(self._device(addr, 4).read_block(reg, 1)[0])
+
+    def write_word_data(self, addr, reg, value):
+        self._done(self._device(addr, 4).write_block(reg, [value & 0xFF, value >> 8]))
+
+    def read_word_data(self, addr, reg):
+        low, high = self._done(self._device(addr, 5).read_block(reg, 2))
+        return low | high << 8
+
+    def write_i2c_block_data(self, addr, reg, data):
+        if len(data) > 32:
+            raise ValueError("SMBus block longer than 32 bytes")
+        model = self._device(addr, 2 + len(data))
+        if self.late is not None:
+            data = data[:self.cut.randint(0, len(data))]
+        self._done(model.write_block(reg, list(data)))
+
+    def read_i2c_block_data(self, addr, reg, length=32):
+        if length > 32:
+            raise ValueError("SMBus block longer than 32 bytes")
+        return self._done(self._device(addr, 3 + length).read_block(reg, length))
+
+
+class RegisterModel(object):
+    """ 256 byte registers, a block access starts at reg and
+    the register pointer increments after every byte """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.regs = bytearray(256)
+        self.pointer = 0
+
+    def next_register(self, reg):
+        return (reg + 1) & 0xFF
+
+    def write_register(self, reg, value):
+        self.regs[reg] = value
+
+    def read_register(self, reg):
+        return self.regs[reg]
+
+    def write_byte(self, value):
+        # a bare byte sets the register pointer
+        self.pointer = value
+
+    def read_byte(self):
+        value = self.read_register(self.pointer)
+        self.pointer = self.next_register(self.pointer)
+        return value
+
+    def write_block(self, reg, data):
+        for value in data:
+            self.write_register(reg, value)
+            reg = self.next_register(reg)
+        self.pointer = reg
+
+    def read_block(self, reg, length):
+        data = []
+        for i in range(length):
+            data.append(self.read_register(reg))
+            reg = self.next_register(reg)
+        self.pointer = reg
+        return data
+
+
+class SC16IS750Model(RegisterModel):
+    """ SC16IS750 UART bridge with a GPS on the far side,
+    feed: NMEA file name or list of sentences, looped,
+    realtime: bytes arrive at the GPS baud, one epoch (the sentences
+    from one RMC to the next) per period, else the FIFO is topped up
+    instantly on every RXLVL read, up to the end of a sentence if gap,
+    the GPS answers PMTK605, PMTK220 and PMTK251, and garbles every
+    byte while the bridge divisor does not match its baud """
+
+    RELEASE = nmea0183.build('PMTK705,AXN_2.10_3339_2012072601,5223,PA6H,1.0')
+
+    def __init__(self, feed=(), baud=9600, realtime=False, period=1.0,
+                 gap=True, loop=True):
+        if isinstance(feed, str):
+            feed = open(feed).readlines()
+        self.epochs = self._epochs([line.rstrip('\r\n') + '\r\n' for line in feed])
+        self.gps_baud = baud
+        self.realtime = realtime
+        self.period = period
+        self.gap = gap
+        self.loop = loop
+        self.overflow = 0
+        self.polls = 0
+        self.tx = bytearray()
+        self.sent = []
+        RegisterModel.__init__(self)
+
+    @staticmethod
+    def _epochs(lines):
+        epochs = [[]]
+        for line in lines:
+            if line[3:6] == 'RMC' and epochs[-1]:
+                epochs.append([])
+            epochs[-1].append(line)
+        return [''.join(epoch) for epoch in epochs if epoch]
+
+    def reset(self):
+        RegisterModel.reset(self)
+        self.rx = collections.deque()
+        self.inject = collections.deque()
+        self.epoch = 0
+        self.pos = 0
+        self.start = time.time()
+        self.next_byte = self.start
+        # divisor latch of 9600 baud, LCR 8N1
+        self.dll, self.dlh = 96, 0
+        self.regs[0x03] = 0x03
+
+    def bridge_baud(self):
+        divisor = self.dll | self.dlh << 8
+        return 14.7456e6 / (16 * divisor) if divisor else 0
+
+    def baud_matches(self):
+        return abs(self.bridge_baud() - self.gps_baud) < 0.03 * self.gps_baud
+
+    def _register(self, reg):
+        # R/W bit and channel bits dropped, 4 bit register address
+        return (reg >> 3) & 0x0F
+
+    def _next_feed_byte(self):
+        """ next byte from the GPS, None at the end of a finished feed """
+        if self.inject:
+            return self.inject.popleft()
+        if not self.epochs or (not self.loop and self.epoch >= len(self.epochs)):
+            return None
+        text = self.epochs[self.epoch % len(self.epochs)]
+        char = text[self.pos]
+        self.pos += 1
+        if self.pos == len(text):
+            self.epoch += 1
+            self.pos = 0
+        return ord(char)
+
+    def _deliver(self, value):
+        if not self.baud_matches():
+            value = 0xFF
+        if len(self.rx) < 64:
+            self.rx.append(value)
+        else:
+            self.overflow += 1
+
+    def fill(self):
+        """ move the bytes that have arrived into the RX FIFO """
+        self.polls += 1
+        if not self.realtime:
+            while len(self.rx) < 64:
+                value = self._next_feed_byte()
+                if value is None:
+                    break
+                self._deliver(value)
+                if value == 0x0A and self.gap:
+                    break
+            return
+
+        now = time.time()
+        char_time = 10.0 / self.gps_baud
+        while self.next_byte <= now:
+            epoch = self.epoch
+            value = self._next_feed_byte()
+            if value is None:
+                break
+            self._deliver(value)
+            self.next_byte += char_time
+            if self.epoch != epoch:
+                # the next epoch starts one period after this one
+                self.next_byte = max(self.next_byte,
+                                     self.start + self.epoch * self.period)
+
+    def _receive(self, value):
+        """ a byte sent to the GPS """
+        self.tx.append(value)
+        if value != 0x0A:
+            return
+        line = str(self.tx).rstrip('\r\n')
+        del self.tx[:]
+        if not self.baud_matches():
+            return
+        self.sent.append(line)
+        if line.startswith('$PMTK605'):
+            self.inject.extend(bytearray(self.RELEASE))
+        elif line.startswith('$PMTK220,'):
+            self.period = int(line[9:].split('*')[0]) / 1000.0
+            self.start = time.time() - self.epoch * self.period
+        elif line.startswith('$PMTK251,'):
+            self.gps_baud = int(line[9:].split('*')[0])
+
+    def write_register(self, reg, value):
+        reg = self._register(reg)
+        lcr = self.regs[0x03]
+        if lcr & 0x80 and reg == 0x00:
+            self.dll = value
+        elif lcr & 0x80 and reg == 0x01:
+            self.dlh = value
+        elif reg == 0x00:
+            self._receive(value)
+        elif reg == 0x02 and value & 0x02:
+            # FCR, reset RX FIFO
+            self.rx.clear()
+            self.regs[reg] = value
+        else:
+            self.regs[reg] = value
+
+    def read_register(self, reg):
+        reg = self._register(reg)
+        if reg == 0x00:
+            if self.regs[0x03] & 0x80:
+                return self.dll
+            return self.rx.popleft() if self.rx else 0
+        elif reg == 0x09:  # RXLVL
+            self.fill()
+            return len(self.rx)
+        elif reg == 0x08:  # TXLVL, the UART drains instantly
+            return 64
+        elif reg == 0x06:  # LSR, THR and TSR empty, data ready
+            self.fill()
+            return 0x60 | (0x01 if self.rx else 0x00)
+        return self.regs[reg]
+
+    def next_register(self, reg):
+        # the FIFO registers are not incremented
+        return reg
+
+
+class PCA9685Model(RegisterModel):
+    """ PCA9685 16 channel PWM, registers auto-increment on block
+    accesses only with MODE1 AI set, otherwise every byte of a block
+    lands in the same register, PRESCALE only takes while asleep """
+
+    MODE1 = 0x00
+    LED0_ON_L = 0x06
+    PRESCALE = 0xFE
+    ALL_LED_ON_L = 0xFA
+    AI = 0x20
+    SLEEP = 0x10
+
+    def reset(self):
+        RegisterModel.reset(self)
+        self.regs[self.MODE1] = 0x11
+        self.regs[self.PRESCALE] = 0x1E
+        self.updates = [0] * 16
+
+    def next_register(self, reg):
+        if self.regs[self.MODE1] & self.AI:
+            return (reg + 1) & 0xFF
+        return reg
+
+    def write_register(self, reg, value):
+        if reg == self.PRESCALE and not self.regs[self.MODE1] & self.SLEEP:
+            return
+        self.regs[reg] = value
+        if self.LED0_ON_L <= reg < self.LED0_ON_L + 64:
+            self.updates[(reg - self.LED0_ON_L) / 4] += 1
+        elif self.ALL_LED_ON_L <= reg < self.ALL_LED_ON_L + 4:
+            offset = reg - self.ALL_LED_ON_L
+            for channel in range(16):
+                self.regs[self.LED0_ON_L + 4 * channel + offset] = value
+                self.updates[channel] += 1
+
+    def channel(self, channel):
+        """ (on, off) counts of a channel """
+        base = self.LED0_ON_L + 4 * channel
+        regs = self.regs
+        return (regs[base] | (regs[base + 1] & 0x1F) << 8,
+                regs[base + 2] | (regs[base + 3] & 0x1F) << 8)
+
+    def frequency(self):
+        return 25e6 / (4096 * (self.regs[self.PRESCALE] + 1))
+
+    def pulse_us(self, channel):
+        """ high time of a channel in us """
+        on, off = self.channel(channel)
+        return ((off - on) % 4096) * 1e6 / (4096 * self.frequency())
+
+
+class PCF8574LCDModel(object):
+    """ HD44780 LCD on a PCF8574 backpack,
+    P0 RS, P1 RW, P2 E, P3 backlight, P4-P7 data,
+    a nibble is latched on the falling edge of E, the controller
+    powers up in 8 bit mode where every nibble is a whole byte
+    (D0-D3 read as 0), a function set switches between 8 and 4 bit
+    mode, reset keeps the mode """
+
+    RS = 0x01
+    E = 0x04
+    BACKLIGHT = 0x08
+    # DDRAM address of each line of a 20x4 display
+    LINES = (0x00, 0x40, 0x14, 0x54)
+
+    def __init__(self, width=20, height=4):
+        self.width = width
+        self.height = height
+        self.eight_bit = True
+        self.reset()
+
+    def reset(self):
+        self.port = 0
+        self.high = None
+        self.ddram = bytearray(' ' * 128)
+        self.cgram = bytearray(64)
+        self.address = 0
+        self.cgram_mode = False
+        self.writes = 0
+        self.commands = 0
+        self.characters = 0
+
+    def write_byte(self, value):
+        self.writes += 1
+        if self.port & self.E and not value & self.E:
+            self._nibble(self.port >> 4, self.port & self.RS)
+        self.port = value
+
+    def read_byte(self):
+        return self.port
+
+    def write_block(self, reg, data):
+        # the backpack has no registers, every byte goes to the port
+        self.write_byte(reg)
+        for value in data:
+            self.write_byte(value)
+
+    def read_block(self, reg, length):
+        return [self.port] * length
+
+    def _nibble(self, nibble, rs):
+        if self.eight_bit:
+            value = nibble << 4
+        elif self.high is None:
+            self.high = nibble
+            return
+        else:
+            value, self.high = self.high << 4 | nibble, None
+        if rs:
+            self._data(value)
+        else:
+            self._command(value)
+
+    def _command(self, value):
+        self.commands += 1
+        if value & 0x80:
+            self.address = value & 0x7F
+            self.cgram_mode = False
+        elif value & 0x40:
+            self.address = value & 0x3F
+            self.cgram_mode = True
+        elif value & 0x20:
+            # function set, DL selects 8 or 4 bit, the nibble phase restarts
+            self.eight_bit = bool(value & 0x10)
+            self.high = None
+        elif value == 0x01:
+            self.ddram[:] = ' ' * 128
+            self.address = 0
+            self.cgram_mode = False
+        elif value == 0x02:
+            self.address = 0
+            self.cgram_mode = False
+
+    def _data(self, value):
+        self.characters += 1
+        if self.cgram_mode:
+            self.cgram[self.address] = value
+            self.address = (self.address + 1) & 0x3F
+        else:
+            self.ddram[self.address] = value
+            self.address = (self.address + 1) & 0x7F
+
+    def backlight(self):
+        return bool(self.port & self.BACKLIGHT)
+
+    def text(self):
+        """ the lines on the display """
+        return [str(self.ddram[start:start + self.width])
+                for start in self.LINES[:self.height]]
+
+
+def install(latency=0.0, scl=100e3, busnum=-1):
+    """ open a SimSMBus for every bus from now on, returns the one
+    of busnum (default: the Pi's) to attach models to,
+    reopening a bus (e.g. I2CBus.reopen) gets the same SimSMBus
+    back, as the devices stay on a real bus """
+    buses = {}
+
+    def factory(number):
+        if number not in buses:
+            buses[number] = SimSMBus(number, latency, scl)
+        return buses[number]
+
+    Adafruit_I2C.setBackend(factory)
+    return bus(busnum)
+
+
+def bus(busnum=-1):
+    """ the SimSMBus behind a bus number """
+    return Adafruit_I2C.getBus(busnum).smbus
+
+
+if __name__ == "__main__":
+    # the drivers on a simulated bus
+    from SC16IS750_I2C import GPS_I2C
+    from LCD_I2C import LCD_I2C
+
+    sim = install()
+    sim.attach(0x48, SC16IS750Model('tests/nmea_sample.nmea'))
+    lcd_model = sim.attach(0x3f, PCF8574LCDModel())
+
+    GPS = GPS_I2C(0x48, sentences=('RMC', 'GGA'), adaptive=False)
+    fix = GPS.parse_sentence()
+    LCD = LCD_I2C(0x3f)
+    LCD.E_PULSE = LCD.E_DELAY = 0
+    LCD.initialize()
+    LCD.send_string("%s" % fix["datetime"], 1)
+    LCD.send_string("%.4f%s,%.4f%s" % (fix["latitude"], fix["lat_dir"],
+                                       fix["longitude"], fix["lon_dir"]), 2)
+    print "\n".join(lcd_model.text())
+    for address, (count, nbytes) in sorted(sim.per_device.items()):
+        print "0x%02X: %d transactions, %d bytes" % (address, count, nbytes)
@@ -34,9 +34,28 @@
 
 ''' modified by Ren Ye, 20160331 to class file '''
 
-import smbus
 import time
-from Adafruit_I2C import Adafruit_I2C
+import threading
+from Adafruit_I2C import Adafruit_I2C, I2CError
+
+# 5x8 custom characters, one row of 5 pixels per byte, top row first
+def _mirror(rows):
+    return tuple(int('{0:05b}'.format(row)[::-1], 2) for row in rows)
+
+def _flip(rows):
+    # upside down, the cursor row stays blank
+    return tuple(rows[6::-1]) + rows[7:]
+
+ARROW_N = (0b00100, 0b01110, 0b10101, 0b00100, 0b00100, 0b00100, 0b00100, 0)
+ARROW_E = (0, 0b00100, 0b00010, 0b11111, 0b00010, 0b00100, 0, 0)
+ARROW_NE = (0, 0b01111, 0b00011, 0b00101, 0b01001, 0b10000, 0, 0)
+# clockwise from straight up, 45 degrees apart
+ARROWS = (ARROW_N, ARROW_NE, ARROW_E, _flip(ARROW_NE),
+          _flip(ARROW_N), _mirror(_flip(ARROW_NE)), _mirror(ARROW_E), _mirror(ARROW_NE))
+# a cell of a bar graph with 1 to 4 of its 5 columns filled from the left
+BARS = tuple((0x1F & ~(0x1F >> columns),) * 7 + (0,) for columns in range(5))
+# the full block of the A00 character ROM
+FULL_BLOCK = chr(0xFF)
 
 class LCD_I2C(Adafruit_I2C):
 
@@ -102,13 +121,60 @@ class LCD_I2C(Adafruit_I2C):
     E_PULSE = 0.0005
     E_DELAY = 0.0005
 
+    # packed writes send the port bytes of many characters in block
+    # writes, a byte takes 90 us on the wire at 100 kHz, longer than
+    # the E pulse (450 ns) and a command (37 us) need, PACKED_DELAY
+    # adds a sleep after each block for slow displays or fast buses
+    PACKED = True
+    PACKED_DELAY = 0.0
+    # SMBus command byte and 32 data bytes
+    BLOCK = 33
+
+    # CGRAM holds 8 custom characters, codes 0 to 7
+    GLYPH_SLOTS = 8
+
+    # port bytes of each of the 256 characters by (mode, backlight)
+    _nibble_tables = {}
+
+    # a DDRAM jump costs one send, as does rewriting one unchanged
+    # character, changed runs this close are merged
+    MERGE_GAP = 1
+
     def __init__(self, address, busnum=-1, debug=False, height = 4, width = 20):
         Adafruit_I2C.__init__(self, address, busnum, debug)
         self.height = height
         self.width = width
+        # DDRAM address of the first character of each line
+        self.line_addr = [line & ~self.LCD_SETDDRAMADDR for line in
+                          (self.LCD_LINE_1, self.LCD_LINE_2,
+                           self.LCD_LINE_3, self.LCD_LINE_4)][:height]
+        # frame: what the display should show, screen: what it shows,
+        # None until initialize or clear_screen
+        self.frame = [bytearray(' ' * width) for i in range(height)]
+        self.screen = None
+        self.cursor = None
+        self.backlight = self.LCD_BACKLIGHT
+        # rows of the glyph in each CGRAM slot, least recently used first,
+        # slots uploaded by the next refresh, guarded by the frame lock
+        self.glyphs = []
+        self._glyph_used = {}
+        self._glyph_clock = 0
+        self._glyph_pending = set()
+        # frame updates from the callers against the refresher thread,
+        # screen and cursor are guarded by the device transaction
+        self._frame_lock = threading.Lock()
+        self._dirty_event = threading.Event()
+        self._stop_event = threading.Event()
+        self.refresher = None
+        # a failed write left the nibble phase unknown
+        self.out_of_sync = False
+        self.reset_stats()
 
     def initialize(self, backlight = True):
         # Initialise display
+        self.backlight = self.LCD_BACKLIGHT if backlight else self.LCD_NOBACKLIGHT
+        # CGRAM holds garbage after power up
+        self._reupload_glyphs()
         self.send_byte(0x33, self.LCD_CMD) # 110011 Initialise to 8-line mode first
         self.send_byte(0x32, self.LCD_CMD) # 110010 Initialise then to 4-line mode
         self.send_byte(0x06, self.LCD_CMD) # 000110 Cursor move direction
@@ -120,9 +186,37 @@ class LCD_I2C(Adafruit_I2C):
         #     self.send_byte(self.LCD_NOBACKLIGHT,self.LCD_CMD)
         self.send_byte(0x01, self.LCD_CMD) # 000001 Clear display
         time.sleep(self.E_DELAY)
+        self._cleared()
 
     def clear_screen(self):
-        self.send_byte(0x01, self.LCD_CMD) # 000001 Clear display
+        with self.transaction():
+            self.send_byte(0x01, self.LCD_CMD) # 000001 Clear display
+            self._cleared()
+            with self._frame_lock:
+                for line in self.frame:
+                    line[:] = ' ' * self.width
+
+    def resync(self):
+        """ bring the controller back into 4 bit nibble phase after
+        a failed write, 0x33, 0x32 as initialize does, from any phase
+        the 0x3 nibbles end up in 8 bit mode and the 0x2 one switches
+        back to 4 bit, then the function set again, the next refresh
+        rewrites the whole screen and glyphs are uploaded again """
+        with self.transaction():
+            self.out_of_sync = True
+            self.screen = None
+            self.cursor = None
+            self._reupload_glyphs()
+            self.send_byte(0x33, self.LCD_CMD)
+            self.send_byte(0x32, self.LCD_CMD)
+            self.send_byte(0x28, self.LCD_CMD)
+            self.out_of_sync = False
+            self.stats['resyncs'] += 1
+
+    def _cleared(self):
+        # a cleared display shows spaces with the cursor home
+        self.screen = [bytearray(' ' * self.width) for i in range(self.height)]
+        self.cursor = 0
 
     def send_byte(self, bits, mode):
         # Send byte to data pins
@@ -130,16 +224,115 @@ class LCD_I2C(Adafruit_I2C):
         # mode = 1 for data
         #        0 for command
 
-        bits_high = mode | (bits & 0xF0) | self.LCD_BACKLIGHT
-        bits_low = mode | ((bits<<4) & 0xF0) | self.LCD_BACKLIGHT
+        port = self.nibble_table(mode)[bits]
+        bits_high = ord(port[0])
+        bits_low = ord(port[3])
+
+        # both nibbles of one byte, not interleaved with another thread
+        with self.transaction():
+            # High bits
+            Adafruit_I2C.writeRaw8(self, bits_high)
+            self.toggle_enable(bits_high)
+
+            # Low bits
+            Adafruit_I2C.writeRaw8(self, bits_low)
+            self.toggle_enable(bits_low)
+
+    def nibble_table(self, mode):
+        """ port bytes of every byte value in mode with the current
+        backlight: data set, E high and E low for each nibble, high
+        nibble first, built once per mode and backlight """
+        key = (mode, self.backlight)
+        table = self._nibble_tables.get(key)
+        if table is None:
+            table = []
+            for bits in range(256):
+                high = mode | self.backlight | (bits & 0xF0)
+                low = mode | self.backlight | ((bits << 4) & 0xF0)
+                table.append(str(bytearray((high, high | self.ENABLE, high,
+                                            low, low | self.ENABLE, low))))
+            table = self._nibble_tables[key] = tuple(table)
+        return table
+
+    def nibbles(self, data, mode):
+        """ port bytes of a sequence of bytes """
+        table = self.nibble_table(mode)
+        return bytearray(''.join([table[bits] for bits in data]))
+
+    def set_backlight(self, on):
+        with self.transaction():
+            self.backlight = self.LCD_BACKLIGHT if on else self.LCD_NOBACKLIGHT
+            Adafruit_I2C.writeRaw8(self, self.backlight)
+
+    def glyph(self, rows):
+        """ character of a custom glyph (8 rows of 5 pixels), a CGRAM
+        slot is picked unless one already holds it and the next refresh
+        uploads it, no bus I/O here, a full CGRAM gives up its least
+        recently used slot, characters of the old glyph still on screen
+        change with it """
+        rows = tuple(rows)
+        with self._frame_lock:
+            if rows in self.glyphs:
+                slot = self.glyphs.index(rows)
+            else:
+                if len(self.glyphs) < self.GLYPH_SLOTS:
+                    slot = len(self.glyphs)
+                    self.glyphs.append(rows)
+                else:
+                    slot = self.glyphs.index(min(self.glyphs, key=self._glyph_used.get))
+                    del self._glyph_used[self.glyphs[slot]]
+                    self.glyphs[slot] = rows
+                self._glyph_pending.add(slot)
+            self._glyph_used[rows] = self._glyph_clock = self._glyph_clock + 1
+        return chr(slot)
 
-        # High bits
-        Adafruit_I2C.writeRaw8(self, bits_high)
-        self.toggle_enable(bits_high)
+    def _reupload_glyphs(self):
+        # CGRAM content unknown, the next refresh uploads every slot
+        with self._frame_lock:
+            self._glyph_pending.update(range(len(self.glyphs)))
 
-        # Low bits
-        Adafruit_I2C.writeRaw8(self, bits_low)
-        self.toggle_enable(bits_low)
+    def bearing_arrow(self, degrees):
+        """ arrow character of a direction, degrees clockwise
+        from straight up, to the nearest 45 """
+        return self.glyph(ARROWS[int(round(degrees / 45.0)) % 8])
+
+    def bar(self, fraction, cells):
+        """ bar graph of a fraction (0 to 1) over cells characters,
+        to a fifth of a cell """
+        columns = int(round(min(max(fraction, 0.0), 1.0) * cells * 5))
+        full, part = divmod(columns, 5)
+        bar = FULL_BLOCK * full
+        if part:
+            bar += self.glyph(BARS[part])
+        return bar.ljust(cells)
+
+    def write_port(self, port):
+        """ port bytes in block writes, the bus time of each
+        byte paces the E pulses, never retried: a block that failed
+        part way has clocked some nibbles in already, the controller
+        is resynced and the I2CError passed on """
+        with self.transaction():
+            if self.out_of_sync:
+                self.resync()
+            try:
+                for start in range(0, len(port), self.BLOCK):
+                    Adafruit_I2C.writeRawList(self, port[start:start + self.BLOCK],
+                                              retry=False)
+                    if self.PACKED_DELAY:
+                        time.sleep(self.PACKED_DELAY)
+            except I2CError:
+                self.out_of_sync = True
+                self.resync()
+                raise
+
+    def send_bytes(self, data, mode):
+        """ send a sequence of bytes, packed in block writes
+        unless PACKED is off """
+        if self.PACKED:
+            self.write_port(self.nibbles(data, mode))
+        else:
+            with self.transaction():
+                self._send(None, data, mode)
 
     def toggle_enable(self, bits):
         # Toggle enable
@@ -149,27 +342,161 @@ class LCD_I2C(Adafruit_I2C):
         Adafruit_I2C.writeRaw8(self, bits & ~self.ENABLE)
         time.sleep(self.E_DELAY)
 
-    def send_string(self, message, line):
-        # Send string to display
+    def set_line(self, message, line):
+        """ put a message on a line of the frame, the display is
+        updated by the next refresh """
         if line > self.height:
             raise ValueError, "not enought lines"
-        elif line == 1:
-            LCD_LINE = self.LCD_LINE_1
-        elif line == 2:
-            LCD_LINE = self.LCD_LINE_2
-        elif line == 3:
-            LCD_LINE = self.LCD_LINE_3
-        elif line == 4:
-            LCD_LINE = self.LCD_LINE_4
-        else:
+        elif line < 1:
             raise ValueError, "not supported line number"
+        with self._frame_lock:
+            self.frame[line - 1][:] = message[:self.width].ljust(self.width, " ")
+            self.stats['updates'] += 1
+        self._dirty_event.set()
 
-        message = message.ljust(self.width," ")
-
-        self.send_byte(LCD_LINE, self.LCD_CMD)
+    def send_string(self, message, line):
+        # Send string to display, only the characters that changed,
+        # left to the refresher thread while it runs
+        self.set_line(message, line)
+        if self.refresher is None:
+            self.refresh((line,))
 
+    def dirty_runs(self, new, old):
+        """ [start, end) of the runs of characters differing
+        between two lines, old None if unknown """
+        if old is None:
+            return [(0, self.width)]
+        runs = []
         for i in range(self.width):
-            self.send_byte(ord(message[i]),self.LCD_CHR)
+            if new[i] != old[i]:
+                if runs and i - runs[-1][1] <= self.MERGE_GAP:
+                    runs[-1][1] = i + 1
+                else:
+                    runs.append([i, i + 1])
+        return runs
+
+    def refresh(self, lines=None):
+        """ write the changed runs of the frame lines (1 based, all by
+        default) to the display, jumping over unchanged characters
+        with a DDRAM address command """
+        tic = time.time()
+        sends = 0
+        with self._frame_lock:
+            frame = [bytearray(line) for line in self.frame]
+            uploads = [(slot, self.glyphs[slot]) for slot in sorted(self._glyph_pending)]
+            self._glyph_pending.clear()
+        with self.transaction():
+            if self.screen is None:
+                # nothing on screen is known, every line is rewritten
+                lines = None
+            # the cursor is unknown if the refresh fails half way
+            cursor, self.cursor = self.cursor, None
+            port = bytearray()
+            written = []
+            for slot, rows in uploads:
+                # the address counter moves to CGRAM, the text jumps back
+                self._send(port, (self.LCD_SETCGRAMADDR | slot << 3,), self.LCD_CMD)
+                self._send(port, rows, self.LCD_CHR)
+                cursor = None
+            for line in lines or range(1, self.height + 1):
+                new = frame[line - 1]
+                old = self.screen[line - 1] if self.screen is not None else None
+                base = self.line_addr[line - 1]
+                for start, end in self.dirty_runs(new, old):
+                    if base + start != cursor:
+                        self._send(port, (self.LCD_SETDDRAMADDR | (base + start),), self.LCD_CMD)
+                        sends += 1
+                    self._send(port, new[start:end], self.LCD_CHR)
+                    sends += end - start
+                    cursor = base + end
+                    if old is not None:
+                        written.append((old, new, start, end))
+            if port:
+                self.write_port(port)
+            self.cursor = cursor
+            for old, new, start, end in written:
+                old[start:end] = new[start:end]
+            if self.screen is None:
+                self.screen = frame
+            self.stats['refreshes'] += 1
+            self.stats['glyph_uploads'] += len(uploads)
+            self.stats['lines'] += len(lines or frame)
+            self.stats['sends'] += sends
+            self.stats['seconds'] += time.time() - tic
+
+    def _send(self, port, data, mode):
+        # packed: queued for one write_port, else sent now, a byte
+        # that failed half way leaves the nibble phase unknown
+        if self.PACKED:
+            port.extend(self.nibbles(data, mode))
+            return
+        if self.out_of_sync:
+            self.resync()
+        try:
+            for bits in data:
+                self.send_byte(bits, mode)
+        except I2CError:
+            self.out_of_sync = True
+            self.resync()
+            raise
+
+    def start_refresher(self, rate=5.0):
+        """ background refresh, callers only set_line (or send_string)
+        and a thread redraws the frame at most rate times a second,
+        updates in between are coalesced into one refresh,
+        one refresher at a time """
+        if self.refresher is not None and self.refresher.is_alive():
+            raise RuntimeError("refresher already running")
+        self._stop_event.clear()
+        self.refresher = threading.Thread(target=self._refresh_loop,
+                                          args=(1.0 / rate,),
+                                          name="LCD_I2C refresher")
+        self.refresher.daemon = True
+        self.refresher.start()
+
+    def stop_refresher(self, timeout=2.0):
+        """ stop background refresh, the thread exits after
+        the refresh it is writing, nothing to do if none is running """
+        if self.refresher is None:
+            return
+        self._stop_event.set()
+        self._dirty_event.set()
+        self.refresher.join(timeout)
+        self.refresher = None
+
+    def _refresh_loop(self, period):
+        while not self._stop_event.is_set():
+            self._dirty_event.wait()
+            if self._stop_event.is_set():
+                break
+            self._dirty_event.clear()
+            tic = time.time()
+            try:
+                self.refresh()
+            except I2CError:
+                # the controller was resynced (or will be on the next
+                # write) and the whole screen is redrawn next time
+                self.stats['i2c_errors'] += 1
+                self._dirty_event.set()
+            self._stop_event.wait(max(period - (time.time() - tic), 0))
+
+    def reset_stats(self):
+        self.stats = {'refreshes': 0, 'lines': 0, 'sends': 0, 'seconds': 0.0,
+                      'updates': 0, 'i2c_errors': 0, 'glyph_uploads': 0,
+                      'resyncs': 0}
+
+    def refresh_stats(self):
+        """ bytes sent and time spent since reset_stats, against
+        rewriting every refreshed line in full (address + width
+        characters) """
+        stats = dict(self.stats)
+        refreshes = stats['refreshes'] or 1
+        full = stats['lines'] * (self.width + 1)
+        stats['full_sends'] = full
+        stats['sends_per_refresh'] = stats['sends'] / float(refreshes)
+        stats['saved'] = 1 - stats['sends'] / float(full) if full else 0.0
+        stats['ms_per_refresh'] = 1e3 * stats['seconds'] / refreshes
+        return stats
 
 if __name__ == '__main__':
     LCD = LCD_I2C(0x3f)
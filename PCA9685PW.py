@@ -1,11 +1,92 @@
 #!/usr/bin/python
 
-# from Adafruit_PWM_Servo_Driver import PWM
 import time
 
 import math
+import ConfigParser
 from Adafruit_I2C import Adafruit_I2C
 
+# ============================================================================
+# Servo / ESC calibration
+# ============================================================================
+
+class ServoProfile(object):
+    """ input (angle in degrees or throttle in %) to pulse of one channel,
+    -limit..0..limit maps linearly to min_pulse..center_pulse..max_pulse
+    (ms), trim (us) shifts the whole range, reverse swaps the ends,
+    rate limits the input change per second (0: off),
+    compile() turns it into a table of tick counts so ticks() is one
+    lookup, with enough entries per unit that no tick is skipped """
+
+    KINDS = ('angle', 'throttle')
+
+    def __init__(self, kind='angle', limit=None, min_pulse=0.5, center_pulse=1.5,
+                 max_pulse=2.5, trim=0.0, reverse=False, rate=0.0, name=None):
+        if kind not in self.KINDS:
+            raise ValueError("unknown servo kind %s" % kind)
+        if not min_pulse < center_pulse < max_pulse:
+            raise ValueError("pulses must be min < center < max")
+        self.kind = kind
+        self.limit = limit or (90 if kind == 'angle' else 100)
+        self.min_pulse = min_pulse
+        self.center_pulse = center_pulse
+        self.max_pulse = max_pulse
+        self.trim = trim
+        self.reverse = reverse
+        self.rate = rate
+        self.name = name
+        self.table = None
+        self.last = None
+        self.lastTime = None
+
+    @classmethod
+    def fromConfig(cls, config, section):
+        """ profile of an ini section, see servo.ini """
+        def get(option, convert, default):
+            if config.has_option(section, option):
+                return convert(section, option)
+            return default
+        return cls(kind=get('kind', config.get, 'angle'),
+                   limit=get('limit', config.getfloat, None),
+                   min_pulse=get('min_pulse', config.getfloat, 0.5),
+                   center_pulse=get('center_pulse', config.getfloat, 1.5),
+                   max_pulse=get('max_pulse', config.getfloat, 2.5),
+                   trim=get('trim', config.getfloat, 0.0),
+                   reverse=get('reverse', config.getboolean, False),
+                   rate=get('rate', config.getfloat, 0.0),
+                   name=section)
+
+    def pulse(self, value):
+        """ pulse in ms of an input, without the table """
+        if self.reverse:
+            value = -value
+        if value >= 0:
+            pulse = self.center_pulse + value * (self.max_pulse - self.center_pulse) / self.limit
+        else:
+            pulse = self.center_pulse + value * (self.center_pulse - self.min_pulse) / self.limit
+        pulse += self.trim / 1000.0
+        return min(max(pulse, self.min_pulse), self.max_pulse)
+
+    def compile(self, ticksPerUs):
+        """ tick table at ticksPerUs (see PCA9685PW.setPWMFreq) """
+        span = max(self.max_pulse - self.center_pulse, self.center_pulse - self.min_pulse)
+        self.steps = max(int(math.ceil(span * 1000 * ticksPerUs / self.limit)), 1)
+        count = int(round(2 * self.limit * self.steps)) + 1
+        self.table = [int(self.pulse(-self.limit + float(i) / self.steps) * 1000 * ticksPerUs)
+                      for i in range(count)]
+
+    def ticks(self, value):
+        """ OFF count of an input, rate limited """
+        if not -self.limit <= value <= self.limit:
+            raise ValueError("%s Out of range" % self.kind)
+        if self.rate:
+            now = time.time()
+            if self.last is not None:
+                step = self.rate * (now - self.lastTime)
+                value = min(max(value, self.last - step), self.last + step)
+            self.last, self.lastTime = value, now
+        return self.table[int((value + self.limit) * self.steps + 0.5)]
+
 # ============================================================================
 # Adafruit PCA9685 16-Channel PWM Servo Driver
 # ============================================================================
@@ -29,37 +110,74 @@ class PCA9685PW(object):
 
     # Bits
     __RESTART            = 0x80
+    __AI                 = 0x20
     __SLEEP              = 0x10
     __ALLCALL            = 0x01
     __INVRT              = 0x10
     __OUTDRV             = 0x04
 
-    general_call_i2c = Adafruit_I2C(0x00)
+    # channels per SMBus block write, 4 registers each
+    BATCH_CHANNELS       = 8
+
+    # general call devices by bus number, opened by softwareReset
+    _generalCalls = {}
 
     @classmethod
-    def softwareReset(cls):
-        "Sends a software reset (SWRST) command to all the servo drivers on the bus"
-        cls.general_call_i2c.writeRaw8(0x06)        # SWRST
+    def softwareReset(cls, busnum=-1):
+        """Sends a software reset (SWRST) command to all the servo drivers on the bus,
+        drivers used afterwards must be created again"""
+        device = cls._generalCalls.get(busnum)
+        if device is None:
+            device = cls._generalCalls[busnum] = Adafruit_I2C(0x00, busnum)
+        device.writeRaw8(0x06)        # SWRST
 
-    def __init__(self, address=0x40, quiet=False):
-        self.i2c = Adafruit_I2C(address)
+    def __init__(self, address=0x40, quiet=False, deadband=0, calibration=None, busnum=-1):
+        """ deadband: setPWM skips the write while the OFF count is
+        within deadband ticks of the one on the chip,
+        calibration: ini file of ServoProfiles, see loadCalibration,
+        the chip is not touched until first used, see initialize """
+        self.i2c = Adafruit_I2C(address, busnum)
         self.address = address
         self.quiet = quiet
+        self.deadband = deadband
+        # (on, off) last written to each channel, None if unknown
+        self.shadow = [None] * 16
+        self.resetWriteStats()
+        # (channel, kind) -> ServoProfile, the defaults are the old
+        # 0.5/1.5/2.5ms endpoints
+        self.profiles = {}
+        self.names = {}
+        self.freq = None
+        self.initialized = False
+        if calibration is not None:
+            self.loadCalibration(calibration)
+
+    def initialize(self):
+        """ reset MODE1 and MODE2, all outputs off,
+        done by the first setPWMFreq or setPWM """
         if not self.quiet:
             print "Reseting PCA9685 MODE1 (without SLEEP) and MODE2"
-        self.setAllPWM(0, 0)
-        self.i2c.write8(self.__MODE2, self.__OUTDRV)
-        self.i2c.write8(self.__MODE1, self.__ALLCALL)
-        time.sleep(0.005)                                       # wait for oscillator
+        with self.i2c.transaction():
+            self.i2c.write8(self.__MODE2, self.__OUTDRV)
+            # auto-increment, so a channel's 4 registers are one block
+            # write, still asleep while the outputs are cleared
+            self.i2c.write8(self.__MODE1, self.__ALLCALL | self.__AI | self.__SLEEP)
+            self.i2c.writeList(self.__ALL_LED_ON_L, self._counts(0, 0))
+            self.shadow = [(0, 0)] * 16
 
-        mode1 = self.i2c.readU8(self.__MODE1)
-        mode1 = mode1 & ~self.__SLEEP                 # wake up (reset sleep)
-        self.i2c.write8(self.__MODE1, mode1)
-        time.sleep(0.005)                             # wait for oscillator
+            mode1 = self.i2c.readU8(self.__MODE1)
+            mode1 = mode1 & ~self.__SLEEP                 # wake up (reset sleep)
+            self.i2c.write8(self.__MODE1, mode1)
+            time.sleep(0.005)                             # wait for oscillator
+            self.initialized = True
 
     def setPWMFreq(self, freq):
         """ Sets the PWM frequency """
         self.freq = freq
+        # 4096 ticks per period, setServoPulse multiplies by this
+        self.ticksPerUs = 4096 * freq / 1e6
+        for profile in self.profiles.values():
+            profile.compile(self.ticksPerUs)
         prescaleval = 25000000.0    # 25MHz
         prescaleval /= 4096.0       # 12-bit
         prescaleval /= float(freq)
@@ -71,75 +189,146 @@ class PCA9685PW(object):
         if not self.quiet:
             print "Final pre-scale: %d" % prescale
 
-        oldmode = self.i2c.readU8(self.__MODE1);
-        newmode = (oldmode & 0x7F) | 0x10             # sleep
-        self.i2c.write8(self.__MODE1, newmode)        # go to sleep
-        self.i2c.write8(self.__PRESCALE, int(math.floor(prescale)))
-        self.i2c.write8(self.__MODE1, oldmode)
-        time.sleep(0.005)
-        self.i2c.write8(self.__MODE1, oldmode | 0x80)
-
-    def setPWM(self, channel, on, off):
-        "Sets a single PWM channel"
-        self.i2c.write8(self.__LED0_ON_L+4*channel, on & 0xFF)
-        self.i2c.write8(self.__LED0_ON_H+4*channel, on >> 8)
-        self.i2c.write8(self.__LED0_OFF_L+4*channel, off & 0xFF)
-        self.i2c.write8(self.__LED0_OFF_H+4*channel, off >> 8)
+        with self.i2c.transaction():
+            if not self.initialized:
+                self.initialize()
+            oldmode = self.i2c.readU8(self.__MODE1);
+            newmode = (oldmode & 0x7F) | 0x10             # sleep
+            self.i2c.write8(self.__MODE1, newmode)        # go to sleep
+            self.i2c.write8(self.__PRESCALE, int(math.floor(prescale)))
+            self.i2c.write8(self.__MODE1, oldmode)
+            time.sleep(0.005)
+            self.i2c.write8(self.__MODE1, oldmode | 0x80)
+
+    @staticmethod
+    def _counts(on, off):
+        return [on & 0xFF, on >> 8, off & 0xFF, off >> 8]
+
+    def setPWM(self, channel, on, off, force=False):
+        """ Sets a single PWM channel, skipped if the chip already has
+        on and an off within deadband, unless force """
+        with self.i2c.transaction():
+            if not self.initialized:
+                self.initialize()
+            shadow = self.shadow[channel]
+            if not force and shadow is not None and shadow[0] == on \
+                    and abs(shadow[1] - off) <= self.deadband:
+                self.skipped += 1
+                return
+            # ON_L..OFF_H in one transaction, the outputs update on the STOP
+            self.i2c.writeList(self.__LED0_ON_L+4*channel, self._counts(on, off))
+            self.shadow[channel] = (on, off)
+            self.writes += 1
+            self.channels += 1
 
     def setAllPWM(self, on, off):
         "Sets a all PWM channels"
-        self.i2c.write8(self.__ALL_LED_ON_L, on & 0xFF)
-        self.i2c.write8(self.__ALL_LED_ON_H, on >> 8)
-        self.i2c.write8(self.__ALL_LED_OFF_L, off & 0xFF)
-        self.i2c.write8(self.__ALL_LED_OFF_H, off >> 8)
+        with self.i2c.transaction():
+            if not self.initialized:
+                self.initialize()
+            self.i2c.writeList(self.__ALL_LED_ON_L, self._counts(on, off))
+            self.shadow = [(on, off)] * 16
+            self.writes += 1
+            self.channels += 16
+
+    def setPWMBatch(self, channels, force=False):
+        """ Sets several PWM channels, channels maps channel to (on, off),
+        each run of consecutive channels is one block write of up to
+        BATCH_CHANNELS channels, e.g. {6: (0, 307), 7: (0, 410)},
+        channels the chip already has (see setPWM) are left out """
+        with self.i2c.transaction():
+            if not self.initialized:
+                self.initialize()
+            order = []
+            for channel in sorted(channels):
+                on, off = channels[channel]
+                shadow = self.shadow[channel]
+                if not force and shadow is not None and shadow[0] == on \
+                        and abs(shadow[1] - off) <= self.deadband:
+                    self.skipped += 1
+                else:
+                    order.append(channel)
+            start = 0
+            while start < len(order):
+                end = start + 1
+                while end < len(order) and end - start < self.BATCH_CHANNELS \
+                        and order[end] == order[end - 1] + 1:
+                    end += 1
+                data = []
+                for channel in order[start:end]:
+                    data += self._counts(*channels[channel])
+                    self.shadow[channel] = channels[channel]
+                self.i2c.writeList(self.__LED0_ON_L+4*order[start], data)
+                self.writes += 1
+                self.channels += end - start
+                start = end
+
+    def resetWriteStats(self):
+        self.writes = 0
+        self.channels = 0
+        self.skipped = 0
+
+    def writeStats(self):
+        """ block writes made, channels written and channel updates
+        skipped since resetWriteStats, saved: share of the channel
+        updates skipped, channels and skipped are both in channels,
+        a block write of a batch carries several """
+        total = self.channels + self.skipped
+        return {'writes': self.writes, 'channels': self.channels,
+                'skipped': self.skipped,
+                'saved': self.skipped / float(total) if total else 0.0}
 
     def setServoPulse(self, channel, pulse):
-        pulseLength = 1000000                   # 1,000,000 us per second
-        pulseLength /= float(self.freq)         # e.g. 50 Hz
+        """ pulse in ms, needs setPWMFreq first """
+        ticks = int(pulse * 1000 * self.ticksPerUs)
         if not self.quiet:
-            print "%d us per period" % pulseLength
-        pulseLength /= 4096.0                     # 12 bits of resolution
-        if not self.quiet:
-            print "%d us per bit" % pulseLength
-        pulse *= 1000
-        pulse /= pulseLength
-        if not self.quiet:
-            print pulse
-        self.setPWM(channel, 0, int(pulse))
+            print "%d us per period" % (1e6 / self.freq)
+            print "%d us per bit" % (1 / self.ticksPerUs)
+            print ticks
+        self.setPWM(channel, 0, ticks)
 
-    def setServoAngle(self, channel, angle=0):
-        """ frequency force to 50Hz (20ms),
-        1.5ms => 0 degree, 0.5ms => -90 degree, 2.5ms => 90 degree """
+    def loadCalibration(self, filename):
+        """ ServoProfiles from an ini file, one section per channel:
+            [rudder]
+            channel = 6
+            kind = angle
+            trim = 20
+        returns the channel of each section name """
+        config = ConfigParser.SafeConfigParser()
+        if not config.read(filename):
+            raise IOError("calibration file %s not found" % filename)
+        for section in config.sections():
+            profile = ServoProfile.fromConfig(config, section)
+            channel = config.getint(section, 'channel')
+            self.setProfile(channel, profile)
+            self.names[section] = channel
+        return dict(self.names)
 
-        # define three key points
-        pulse_0 = 1.5
-        pulse_90 = 2.5
-        pulse_270 = 0.5
+    def setProfile(self, channel, profile):
+        """ calibration of the angle or throttle of a channel """
+        if self.freq is not None:
+            profile.compile(self.ticksPerUs)
+        self.profiles[(channel, profile.kind)] = profile
 
-        if 0<=angle<=90:
-            pulse = 1.5 + angle * (pulse_90-pulse_0) / 90
-        elif -90<=angle<0:
-            pulse = 1.5 - angle * (pulse_270-pulse_0) / 90
-        else:
-            raise ValueError("angle Out of range")
-        self.setServoPulse(channel, pulse)
+    def profile(self, channel, kind):
+        """ the ServoProfile of a channel, a default one if not calibrated """
+        profile = self.profiles.get((channel, kind))
+        if profile is None:
+            profile = ServoProfile(kind)
+            self.setProfile(channel, profile)
+        if profile.table is None:
+            raise RuntimeError("setPWMFreq before driving servos")
+        return profile
+
+    def setServoAngle(self, channel, angle=0):
+        """ needs setPWMFreq first, uncalibrated
+        1.5ms => 0 degree, 0.5ms => -90 degree, 2.5ms => 90 degree """
+        self.setPWM(channel, 0, self.profile(channel, 'angle').ticks(angle))
 
     def setServoThrottle(self, channel, throttle=0):
-        """ frequency force to 50Hz (20ms),
+        """ needs setPWMFreq first, uncalibrated
         1.5ms => halt, 0.5ms => reverse, 2.5ms => forward"""
-
-        # define three key points
-        thrust_0 = 1.5
-        thrust_forward = 2.5
-        thrust_reverse = 0.5
-
-        if 0<=throttle<=100:
-            thrust = thrust_0 + throttle * (thrust_forward-thrust_0) / 100
-        elif -100<=throttle<0:
-            thrust = thrust_0 - throttle * (thrust_reverse-thrust_0) / 90
-        else:
-            raise ValueError("thrust Out of range")
-        self.setServoPulse(channel, thrust)
+        self.setPWM(channel, 0, self.profile(channel, 'throttle').ticks(throttle))
 
 if __name__ == "__main__":
     # ===========================================================================
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+""" output frames over several PCA9685 boards,
+a frame is a NumPy array of pulse widths (us), one row of 16 channels
+per board, each frame is diffed against the last one and only the
+changed channels are written, one block write per run of changed
+channels on a board (up to 8 channels per block), runs closer than
+max_gap unchanged channels are merged, rewriting an unchanged channel
+costs 4 bytes but saves a transaction
+
+    boards = [PCA9685PW(0x40), PCA9685PW(0x41)]
+    for board in boards:
+        board.setPWMFreq(50)
+    frame = PWMFrame(boards)
+    pulses = numpy.zeros((2, 16))
+    pulses[0, 6] = 1500
+    frame.write(pulses)
+"""
+
+import time
+import numpy
+
+CHANNELS = 16
+LED0_ON_L = 0x06
+
+
+class PWMFrame(object):
+    """ frame writer of a list of initialised PCA9685PW boards,
+    all channels are driven with ON at 0, OFF at the pulse width,
+    a pulse width of 0 turns the channel off, channels set directly
+    with setPWM in between need invalidate() """
+
+    def __init__(self, boards, max_gap=1):
+        self.boards = list(boards)
+        self.max_gap = max_gap
+        self.block = self.boards[0].BATCH_CHANNELS if self.boards else 8
+        # OFF counts on each board, -1 where unknown
+        self.last = numpy.full((len(self.boards), CHANNELS), -1, dtype=numpy.int32)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.frames = 0
+        self.writes = 0
+        self.channels = 0
+
+    def stats(self):
+        """ frames, block writes and channels written since reset_stats """
+        return {'frames': self.frames, 'writes': self.writes,
+                'channels': self.channels,
+                'writes_per_frame': self.writes / float(self.frames) if self.frames else 0.0}
+
+    def ticks(self, pulses):
+        """ OFF counts of a frame of pulse widths in us """
+        ticks_per_us = numpy.array([[board.ticksPerUs] for board in self.boards])
+        ticks = (numpy.asarray(pulses, dtype=float) * ticks_per_us).astype(numpy.int32)
+        return numpy.clip(ticks, 0, 4095)
+
+    def runs(self, changed):
+        """ (first, last) channels of the block writes of one board,
+        changed: sorted channel numbers """
+        if not len(changed):
+            return []
+        # split where more than max_gap unchanged channels lie between
+        breaks = numpy.flatnonzero(numpy.diff(changed) > self.max_gap + 1) + 1
+        runs = []
+        for run in numpy.split(changed, breaks):
+            first, last = int(run[0]), int(run[-1])
+            while first <= last:
+                end = min(first + self.block - 1, last)
+                runs.append((first, end))
+                first = end + 1
+        return runs
+
+    def write(self, pulses):
+        """ write a frame of pulse widths (us), shape (boards, 16) """
+        self.write_ticks(self.ticks(pulses))
+
+    def write_ticks(self, ticks):
+        """ write a frame of OFF counts, shape (boards, 16) """
+        ticks = numpy.asarray(ticks, dtype=numpy.int32)
+        dirty = ticks != self.last
+        for index in numpy.flatnonzero(dirty.any(axis=1)):
+            board = self.boards[index]
+            row = ticks[index]
+            with board.i2c.transaction():
+                for first, last in self.runs(numpy.flatnonzero(dirty[index])):
+                    # ON_L, ON_H, OFF_L, OFF_H of each channel, ON at 0
+                    data = numpy.zeros((last - first + 1, 4), dtype=numpy.uint8)
+                    data[:, 2] = row[first:last + 1] & 0xFF
+                    data[:, 3] = row[first:last + 1] >> 8
+                    board.i2c.writeList(LED0_ON_L + 4 * first, data.ravel().tolist())
+                    for channel in range(first, last + 1):
+                        board.shadow[channel] = (0, int(row[channel]))
+                    self.last[index, first:last + 1] = row[first:last + 1]
+                    self.writes += 1
+                    self.channels += last - first + 1
+        self.frames += 1
+
+    def invalidate(self):
+        """ forget the outputs, the next frame is written in full,
+        e.g. after PCA9685PW.softwareReset and re-initialising """
+        self.last.fill(-1)
+
+    def play(self, frames, rate, stop=None):
+        """ write an iterable of frames (us) at rate frames per second,
+        until it ends or the stop event is set, returns the frames
+        that missed their slot """
+        period = 1.0 / rate
+        deadline = time.time()
+        late = 0
+        for pulses in frames:
+            if stop is not None and stop.is_set():
+                break
+            self.write(pulses)
+            deadline += period
+            delay = deadline - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # behind, start the next slot from now
+                late += 1
+                deadline = time.time()
+        return late
@@ -6,52 +6,111 @@
 # Arduino I2C slave 0x40
 # it requires 4 bytes of data in: [MSB_degree, LSB_degree, MSB_rpm, LSB_rpm] format
 # 2's complement
+#
+# frame versions, the first byte on the wire is the SMBus command byte
+#   0: command 0, then MSB, LSB of each value (the sketch above)
+#   1: command 0xA1 (FRAME_MARKER | version), sequence number, value
+#      count, MSB, LSB of each value, CRC-8 (polynomial 0x07, as SMBus
+#      PEC) of every byte from the command byte on
 
-import smbus
 import time
-from bitstring import BitArray
+import struct
+from Adafruit_I2C import Adafruit_I2C
+
+FRAME_MARKER = 0xA0
+VERSIONS = (0, 1)
+
+
+def _crc8_table(poly=0x07):
+    table = []
+    for byte in range(256):
+        crc = byte
+        for bit in range(8):
+            crc = ((crc << 1) ^ poly if crc & 0x80 else crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+CRC8_TABLE = _crc8_table()
+
+
+def crc8(data, crc=0):
+    """ CRC-8 of a sequence of byte values """
+    table = CRC8_TABLE
+    for byte in data:
+        crc = table[crc ^ byte]
+    return crc
 
-bus = smbus.SMBus(1)
 
 class PWM_Driver(object):
-    """ send PWM signals to arduino via I2C """
-    def __init__(self, addr, bits=16):
+    """ send PWM signals to arduino via I2C,
+    bits: width of each two's complement value, split into MSB and LSB,
+    version: frame version, 0 for the original sketch """
+    def __init__(self, addr, bits=16, version=0, busnum=1):
+        if version not in VERSIONS:
+            raise ValueError("frame version %s not supported" % version)
+        if version and bits != 16:
+            raise ValueError("framed versions send 16 bit values")
         self.addr = addr
         self.bits = bits
+        self.version = version
+        self.sequence = 0
+        # shared with the other drivers on /dev/i2c-1, opened on first use
+        self.i2c = Adafruit_I2C(addr, busnum)
+        # big endian int16 packers by value count
+        self._packers = {}
+
+    def _pack(self, values):
+        packer = self._packers.get(len(values))
+        if packer is None:
+            packer = self._packers[len(values)] = struct.Struct('>%dh' % len(values))
+        try:
+            return bytearray(packer.pack(*values))
+        except struct.error:
+            raise ValueError("value out of 16 bit range")
+
+    def encode(self, *args):
+        """ (command byte, payload) of the frame of integer values """
+        if self.version == 0:
+            if self.bits == 16:
+                return 0, list(self._pack(args))
+            payload = list()
+            for arg in args:
+                payload += self.extract_msb_lsb(arg, self.bits)
+            return 0, payload
+
+        command = FRAME_MARKER | self.version
+        payload = bytearray((self.sequence, len(args))) + self._pack(args)
+        payload.append(crc8(payload, CRC8_TABLE[command]))
+        self.sequence = (self.sequence + 1) & 0xFF
+        return command, list(payload)
 
     def send_data(self,  *args):
         """ send integer data via I2C """
-        payload=list()
-        for arg in args:
-            payload += self.extract_msb_lsb(arg, self.bits)
-        print payload
-        bus.write_i2c_block_data(self.addr, 0, payload)
+        command, payload = self.encode(*args)
+        self.i2c.writeList(command, payload)
 
     def read_data(self):
-        print bus.read_byte(self.addr)
+        """ status byte of the arduino """
+        return self.i2c.readRaw8()
 
     def extract_msb_lsb(self, val, bits):
-        """ use bitstring.BitArray to convert and extract,
-        auto two's complement"""
-
-        # change value to binary string
-        val_bitarray = BitArray(int=val, length=bits)
-        # length of msb and lsb
-        half_length = int(bits/2)
-        # separate to msb and lsb, string
-        msb, lsb = val_bitarray.bin[:half_length], val_bitarray.bin[half_length:]
-        # convert back to integer so that i2c bus can send
-        return [int(msb, 2), int(lsb, 2)]
+        """ two's complement of val in bits, split into
+        the first bits/2 and the remaining bits """
+        if not -(1 << bits - 1) <= val < (1 << bits - 1):
+            raise ValueError("value out of %d bit range" % bits)
+        low_bits = bits - bits // 2
+        val &= (1 << bits) - 1
+        return [val >> low_bits, val & ((1 << low_bits) - 1)]
 
 if __name__ == "__main__":
     pwm_gen = PWM_Driver(0x04)
     pwm_gen.send_data(100, -15)
     time.sleep(5)
-    pwm_gen.read_data()
+    print pwm_gen.read_data()
     pwm_gen.send_data(-100, 15)
     time.sleep(6)
-    pwm_gen.read_data()
+    print pwm_gen.read_data()
     pwm_gen.send_data(10, 150)
     time.sleep(7)
-    pwm_gen.read_data()
+    print pwm_gen.read_data()
     pwm_gen.send_data(-10, -150)
@@ -5,17 +5,103 @@
 # 2015/12/23
 # change to class type
 
-import smbus
 import time
-import re
-import pynmea2
-from Adafruit_I2C import Adafruit_I2C
+import threading
+import collections
+import nmea0183
+from Adafruit_I2C import Adafruit_I2C, I2CError
 
 """ I2C to UART bridge with SC16IS750
 I2C bus address is 0x4d
 it can also be used as SPI to UART bridge
 """
 
+
+class LineAssembler(object):
+    """ assemble lines out of a byte stream,
+    bytes are kept in a bytearray and split on \n (\r\n),
+    the newline search resumes where the last search stopped,
+    bytes after the last newline are kept for the next line """
+
+    def __init__(self, keepends=False, maxlen=1024):
+        """ keepends: keep the \r\n at the end of each line,
+        maxlen: drop the buffer if no newline within maxlen bytes """
+        self.buffer = bytearray()
+        self.keepends = keepends
+        self.maxlen = maxlen
+        self._scan = 0  # buffer already searched up to here
+        # with bytes lost, where the broken line starts, it is dropped
+        # up to and with its newline, None if no bytes were lost
+        self._resync = None
+
+    def feed(self, data):
+        """ append a list of byte values or a string """
+        self.buffer.extend(data)
+
+    def readline(self):
+        """ pop the first complete line,
+        None if there is no complete line yet """
+        end = self.buffer.find('\n', self._scan)
+        if self._resync is not None and (end < 0 or end >= self._resync):
+            # the complete lines before the loss go out first
+            self._drop_broken()
+            if self._resync is not None:
+                self._scan = len(self.buffer)
+                return None
+            end = self.buffer.find('\n', self._scan)
+        if end < 0:
+            if len(self.buffer) > self.maxlen:
+                # garbage without newline, resync
+                del self.buffer[:]
+            self._scan = len(self.buffer)
+            return None
+
+        line = str(self.buffer[:end + 1])
+        del self.buffer[:end + 1]
+        self._scan = 0
+        if self._resync is not None:
+            self._resync -= end + 1
+        if self.keepends:
+            return line
+        else:
+            return line.rstrip('\r\n')
+
+    def lines(self):
+        """ generator of the complete lines in the buffer """
+        line = self.readline()
+        while line is not None:
+            yield line
+            line = self.readline()
+
+    def clear(self):
+        del self.buffer[:]
+        self._scan = 0
+        self._resync = None
+
+    def _drop_broken(self):
+        # drop the broken line as far as it has been fed
+        end = self.buffer.find('\n', self._resync)
+        if end < 0:
+            del self.buffer[self._resync:]
+        else:
+            del self.buffer[self._resync:end + 1]
+            self._resync = None
+
+    def resync(self):
+        """ bytes of the stream were lost, the line they belonged to
+        is dropped, the bytes already fed up to it and the next
+        newline after it are kept """
+        if self._resync is not None:
+            self._drop_broken()
+            if self._resync is not None:
+                # still in the broken line
+                return
+        start = self.buffer.rfind('\n') + 1
+        del self.buffer[start:]
+        self._scan = min(self._scan, start)
+        self._resync = start
+
+
 # define a class
 class SC16IS750(Adafruit_I2C):
     """ class of SC16IS750 """
@@ -34,9 +120,28 @@ class SC16IS750(Adafruit_I2C):
     EFR = 0x02  # enhanced feature register, only when LCE[7] = 0
     TLR = 0x07  # trigger level register, only when EFR[4] = 1 & MCR[2] = 1
 
-    def __init__(self, address, busnum=-1, debug=False, baud=9600):
-        """ pass initial parameter to the class object """
+    # largest SMBus block transfer
+    I2C_BLOCK_MAX = 32
+    # RX/TX FIFO depth
+    FIFO_SIZE = 64
+    # crystal
+    XTAL = 14.7456e6
+
+    def __init__(self, address, busnum=-1, debug=False, baud=9600, burst=True,
+                 rx_trigger=4, adaptive=True):
+        """ pass initial parameter to the class object,
+        burst: drain the RX FIFO with block reads instead of byte reads,
+        rx_trigger: RX FIFO trigger level, multiple of 4 up to 60,
+        adaptive: sleep between RXLVL polls instead of spinning """
+        if rx_trigger % 4 or not 4 <= rx_trigger <= 60:
+            raise ValueError("RX trigger level must be a multiple of 4 up to 60")
         self.baud = baud
+        self.burst = burst
+        self.rx_trigger = rx_trigger
+        self.adaptive = adaptive
+        # one start, 8 data and one stop bit per character
+        self.char_time = 10.0 / baud
+        self.assembler = LineAssembler(keepends=True)
         super(SC16IS750, self).__init__(address, busnum, debug)
         self.I2C_initialize()
 
@@ -44,26 +149,28 @@ class SC16IS750(Adafruit_I2C):
         """ initialize chip,
         TODO: add parameters to be changed """
 
-        # configure UART register
-        # LCR, enable DLL and DLH write
-        self.write_byte(self.LCR, 0b10000011)
-        # assume 9600 baud
-        # 16*9600 = 14.7456MHz/96
-        self.write_byte(self.DLL, int(14.7456e6/(16*self.baud)))
-        self.write_byte(self.DLH, 0)
-        # enhanced feature
-        self.write_byte(self.EFR, 0b00010000)
-        # LCR, disable DLL and DLH write, 8b wl, 1b sb, no p
-        self.write_byte(self.LCR, 0b00000011)
-
-        # MCR, normal
-        self.write_byte(self.MCR, 0b00000100)
-        # reset FIFO
-        self.write_byte(self.FCR, 0x06)
-        # enable FIFO
-        self.write_byte(self.FCR, 0b00000111)
-        # TLR to be 4, fastest refreshing
-        self.write_byte(self.TLR, 0b00010001)
+        # configure UART register, no other thread may use the
+        # chip while LCR[7] maps DLL/DLH over XHR/IER
+        with self.transaction():
+            # LCR, enable DLL and DLH write
+            self.write_byte(self.LCR, 0b10000011)
+            # 16*9600 = 14.7456MHz/96
+            divisor = self.divisor(self.baud)
+            self.write_byte(self.DLL, divisor & 0xFF)
+            self.write_byte(self.DLH, divisor >> 8)
+            # enhanced feature
+            self.write_byte(self.EFR, 0b00010000)
+            # LCR, disable DLL and DLH write, 8b wl, 1b sb, no p
+            self.write_byte(self.LCR, 0b00000011)
+
+            # MCR, normal
+            self.write_byte(self.MCR, 0b00000100)
+            # reset FIFO
+            self.write_byte(self.FCR, 0x06)
+            # enable FIFO
+            self.write_byte(self.FCR, 0b00000111)
+            # TLR, RX trigger level in 4 characters, TX trigger level 4
+            self.write_byte(self.TLR, (self.rx_trigger / 4) << 4 | 0b0001)
 
         # check status, debug
         if self.debug:
@@ -73,7 +180,30 @@ class SC16IS750(Adafruit_I2C):
             print "LSR: {0:x}".format(self.read_byte(self.LSR))
             print "MSR: {0:x}".format(self.read_byte(self.MSR))
 
-    def write_byte(self, reg, value):
+    def divisor(self, baud):
+        """ divisor latch value of a baud rate """
+        divisor = int(self.XTAL / (16 * baud))
+        if not 1 <= divisor <= 0xFFFF:
+            raise ValueError("baud rate not supported")
+        return divisor
+
+    def set_baud(self, baud):
+        """ reprogram the divisor latch for a new baud rate,
+        the RX FIFO is reset as its content is garbage across a switch """
+        divisor = self.divisor(baud)
+        with self.transaction():
+            # LCR, enable DLL and DLH write, 8b wl, 1b sb, no p
+            self.write_byte(self.LCR, 0b10000011)
+            self.write_byte(self.DLL, divisor & 0xFF)
+            self.write_byte(self.DLH, divisor >> 8)
+            self.write_byte(self.LCR, 0b00000011)
+            # reset RX FIFO, keep FIFO enabled
+            self.write_byte(self.FCR, 0b00000011)
+            self.assembler.clear()
+            self.baud = baud
+            self.char_time = 10.0 / baud
+
+    def write_byte(self, reg, value, retry=True):
         """SC16IS7X0 expects a R/W first, followd by a
         4 bit register address and combine with a value
         """
@@ -82,9 +212,9 @@ class SC16IS750(Adafruit_I2C):
         reg = reg << 3
         # bitwise or with a write bit
         actual_reg = reg | Write_bit
-        Adafruit_I2C.write8(self, actual_reg, value)
+        Adafruit_I2C.write8(self, actual_reg, value, retry)
 
-    def read_byte(self, reg):
+    def read_byte(self, reg, retry=True):
         """SC16IS7X0 expects a R/W first, followd by a
         4 bit register address and combine with a value
         """
@@ -93,37 +223,178 @@ class SC16IS750(Adafruit_I2C):
         reg = reg << 3
         # bitwise or with a write bit
         actual_reg = reg | Read_bit
-        return Adafruit_I2C.readU8(self, actual_reg)
+        return Adafruit_I2C.readU8(self, actual_reg, retry)
+
+    def read_list(self, reg, length, retry=True):
+        """block read of length bytes from one register,
+        the chip does not increment the address on XHR, so
+        successive bytes are popped from the RX FIFO
+        """
+        Read_bit = 0b10000000
+        actual_reg = (reg << 3) | Read_bit
+        return Adafruit_I2C.readList(self, actual_reg, length, retry)
+
+    def read_fifo(self, count):
+        """ read count bytes from the RX FIFO,
+        in burst mode one block read per I2C_BLOCK_MAX bytes,
+        otherwise one byte read per character """
+        data = []
+        self.drain(count, data.extend)
+        return data
+
+    def drain(self, count, sink):
+        """ as read_fifo, each block (or byte) goes to sink as soon as
+        it is read, so a failed transaction loses none of the earlier ones,
+        FIFO reads are never retried, a failed one may have popped bytes,
+        False if one failed with Adafruit_I2C.raiseErrors off (it returned
+        -1, which never reaches sink), I2CError with it on """
+        if self.burst:
+            while count > 0:
+                length = min(count, self.I2C_BLOCK_MAX)
+                data = self.read_list(self.XHR, length, retry=False)
+                if data == -1:
+                    return False
+                sink(data)
+                count -= length
+        else:
+            while count > 0:
+                value = self.read_byte(self.XHR, retry=False)
+                if value == -1:
+                    return False
+                sink((value,))
+                count -= 1
+        return True
+
+    def write_list(self, reg, data, retry=True):
+        """block write of a list of bytes to one register,
+        on XHR successive bytes are pushed into the TX FIFO
+        """
+        Write_bit = 0b00000000
+        actual_reg = (reg << 3) | Write_bit
+        return Adafruit_I2C.writeList(self, actual_reg, data, retry)
 
     def write_sentence(self, sentence):
         """write a sentence to the UART,
-        must end with \r\n"""
-        for i in range(0, len(sentence)):
-            self.write_byte(self.XHR, ord(sentence[i]))
-
-    def read_sentence(self):
+        must end with \r\n,
+        TXLVL (free TX FIFO space) is read before writing and
+        only again when that space is used up, in burst mode each
+        write is one block of up to the free space,
+        TX FIFO writes are never retried, a failed one may have pushed
+        part of its data: the broken line is ended with \r\n so the
+        receiver drops it, and the I2CError passed on"""
+        data = list(bytearray(sentence))
+        pos = 0
+        free = 0
+        with self.transaction():
+            while pos < len(data):
+                if free == 0:
+                    free = self.read_byte(self.TXLVL)
+                    if free == -1:
+                        # raiseErrors off, nothing written yet of this try
+                        free = 0
+                        time.sleep(self.rx_trigger * self.char_time)
+                        continue
+                    if free == 0:
+                        # FIFO full, wait for a few characters to go out
+                        time.sleep(self.rx_trigger * self.char_time)
+                        continue
+                try:
+                    if self.burst:
+                        length = min(free, len(data) - pos, self.I2C_BLOCK_MAX)
+                        result = self.write_list(self.XHR, data[pos:pos + length],
+                                                 retry=False)
+                    else:
+                        length = 1
+                        result = self.write_byte(self.XHR, data[pos], retry=False)
+                except I2CError:
+                    # an extra empty line is harmless, retried
+                    self.write_list(self.XHR, [0x0D, 0x0A])
+                    raise
+                if result == -1:
+                    # the same with raiseErrors off, already printed
+                    self.write_list(self.XHR, [0x0D, 0x0A])
+                    return
+                pos += length
+                free -= length
+
+    def write_command(self, body):
+        """write a NMEA sentence of body, e.g. 'PMTK605',
+        the $, checksum and \r\n are added, returns the sentence"""
+        sentence = nmea0183.build(body)
+        self.write_sentence(sentence)
+        return sentence
+
+    def flush(self, timeout=1.0):
+        """wait until the TX FIFO and shift register are empty,
+        False on timeout"""
+        deadline = time.time() + timeout
+        # LSR[6], THR and TSR empty
+        while not self.read_byte(self.LSR) & 0b01000000:
+            if time.time() > deadline:
+                return False
+            time.sleep(self.rx_trigger * self.char_time)
+        return True
+
+    def read_sentence(self, timeout=None):
         """ read sentence from the FIFO,
         sentence ends with \r\n
-        sentence output to be ascii """
-        sentence = ''  # initialize
-
-        # until newline at end of sentence
-        while not re.search(r'\n$', sentence):
-            # read FIFO length
-            work = self.read_byte(self.RXLVL)
-            # debug
-            # if work > 0:
-            #     print "FIFO length: {0}".format(work)
-            # loop to push fifo data into sentence
-            while 0 < work:
-                sentence += chr(self.read_byte(self.XHR))
-                work -= 1
-
-        # after sentence complete, print out
-        if len(sentence) > 0:
-            return sentence
-        else:
-            return None
+        sentence output to be ascii,
+        bytes of the next sentence stay in the assembler,
+        None if timeout (s) passes first """
+        sentence = self.assembler.readline()
+        last = idle = 0
+        deadline = None if timeout is None else time.time() + timeout
+
+        # until a complete line is assembled
+        while sentence is None:
+            # level and drain in one transaction of this chip
+            with self.transaction():
+                # read FIFO length
+                work = self.read_byte(self.RXLVL)
+                # debug
+                # if work > 0:
+                #     print "FIFO length: {0}".format(work)
+                # drain at the trigger level, or when the line went quiet
+                # below it (e.g. the \r\n tail of a sentence)
+                drain = work > 0 and (not self.adaptive or work >= self.rx_trigger
+                                      or work == last)
+                if drain:
+                    try:
+                        drained = self.drain(work, self.assembler.feed)
+                    except I2CError:
+                        # the bytes of the failed read are gone,
+                        # start again at the next sentence
+                        self.assembler.resync()
+                        raise
+                    if not drained:
+                        # the same with raiseErrors off, already printed
+                        self.assembler.resync()
+            if drain:
+                sentence = self.assembler.readline()
+                last = idle = 0
+            elif self.adaptive:
+                idle = idle + 1 if work == 0 else 0
+                time.sleep(self.poll_delay(work, idle))
+                last = work
+            if deadline is not None and sentence is None \
+                    and time.time() > deadline:
+                break
+
+        return sentence
+
+    def poll_delay(self, level, idle=0):
+        """ sleep before the next RXLVL poll,
+        long enough for the FIFO to reach the trigger level from level,
+        doubled for every empty poll in a row, capped at half the FIFO
+        so it can not overflow between two polls """
+        delay = max(self.rx_trigger - level, 1) * self.char_time
+        delay *= 1 << min(idle, 8)
+        return min(delay, self.FIFO_SIZE / 2 * self.char_time)
+
+    def sentences(self):
+        """ generator of sentences, blocks until each is complete """
+        while True:
+            yield self.read_sentence()
 
     def __str__(self):
         return self.read_sentence()
@@ -151,36 +422,66 @@ class GPS_I2C(SC16IS750):
     PMTK_SET_NMEA_OUTPUT_OFF = \
         '$PMTK314,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0*28\r\n'
 
+    # PMTK314 fields, in order
+    PMTK314_SENTENCES = ('GLL', 'RMC', 'VTG', 'GGA', 'GSA', 'GSV')
+    # sentences of each output_data setting
+    OUTPUT_DATA = {'RMCONLY': ('RMC',),
+                   'RMCGGA': ('RMC', 'GGA'),
+                   'ALLDATA': PMTK314_SENTENCES}
+
     # get version
     PMTK_Q_RELEASE = '$PMTK605*31\r\n'
 
-    def __init__(self, address, busnum=-1, debug=False, baud=9600, update_rate=1, output_data="RMCONLY"):
+    # PMTK251 baud rates
+    PMTK251_BAUDS = (4800, 9600, 14400, 19200, 38400, 57600, 115200)
+    # typical length of each sentence, GSV is sent as 3 sentences
+    SENTENCE_BYTES = {'GLL': 51, 'RMC': 70, 'VTG': 40,
+                      'GGA': 75, 'GSA': 66, 'GSV': 210}
+    # the reader thread checks for stop_reader this often (s)
+    READ_TIMEOUT = 0.5
+
+    def __init__(self, address, busnum=-1, debug=False, baud=9600, update_rate=1, output_data="RMCONLY",
+                 sentences=None, burst=True, rx_trigger=4, adaptive=True, talkers=None):
+        """ sentences: the sentence types to subscribe to, e.g.
+        ('RMC', 'GGA', 'GSA'), overrides output_data,
+        the module is asked for these only and each fix merges them,
+        talkers: the talkers a fix is taken from, e.g. ('GP',) to leave
+        out GN/GL sentences of a multi-constellation module, all if None """
         self.update_rate = update_rate
+        self.talkers = talkers
         self.output_data = output_data
-        super(GPS_I2C, self).__init__(address, busnum, debug, baud)
+        if sentences is None:
+            try:
+                sentences = self.OUTPUT_DATA[output_data]
+            except KeyError:
+                raise ValueError("Output data not supported")
+        if not set(sentences) <= set(self.PMTK314_SENTENCES):
+            raise ValueError("Output data not supported")
+        self.sentences = tuple(sentences)
+        # a fix is merged from the sentences nmea0183 can parse
+        self.fix_types = tuple(t for t in self.sentences if t in nmea0183.FIELDS)
+        if not self.fix_types:
+            raise ValueError("No fix sentence in output data")
+        self.aggregator = nmea0183.FixAggregator(self.fix_types)
+        self.reset_stats()
+        # background reader state, see start_reader
+        self.reader = None
+        self.ring = collections.deque()
+        self._fix = None
+        self._fix_time = None
+        self._fix_lock = threading.Lock()
+        self._fix_event = threading.Event()
+        self._stop_event = threading.Event()
+        super(GPS_I2C, self).__init__(address, busnum, debug, baud, burst, rx_trigger, adaptive)
 
     def GPS_initialize(self):
         """ initialize GPS """
 
         # write update rate to RX of UART
-        if self.update_rate == 1:
-            SC16IS750.write_sentence(self, self.PMTK_SET_NMEA_UPDATE_1HZ)
-        elif self.update_rate == 5:
-            SC16IS750.write_sentence(self, self.PMTK_SET_NMEA_UPDATE_5HZ)
-        elif self.update_rate == 10:
-            SC16IS750.write_sentence(self, self.PMTK_SET_NMEA_UPDATE_10HZ)
-        else:
-            raise ValueError("Update rate not supported")
+        self.set_update_rate(self.update_rate)
 
         # write sentence output to RX of UART
-        if self.output_data == 'RMCONLY':
-            SC16IS750.write_sentence(self, self.PMTK_SET_NMEA_OUTPUT_RMCONLY)
-        elif self.output_data == 'RMCGGA':
-            SC16IS750.write_sentence(self, self.PMTK_SET_NMEA_OUTPUT_RMCGGA)
-        elif self.output_data == 'ALLDATA':
-            SC16IS750.write_sentence(self, self.PMTK_SET_NMEA_OUTPUT_ALLDATA)
-        else:
-            raise ValueError("Output data not supported")
+        SC16IS750.write_sentence(self, self.output_command())
 
         # write q release to RX of UART
         SC16IS750.write_sentence(self, self.PMTK_Q_RELEASE)
@@ -194,44 +495,183 @@ class GPS_I2C(SC16IS750):
         # sleep for a short while
         # time.sleep(1.0/self.update_rate)
 
+    def set_update_rate(self, update_rate):
+        """ PMTK220, fix interval of 1000/update_rate ms, 1 to 10 Hz """
+        if not 1 <= update_rate <= 10:
+            raise ValueError("Update rate not supported")
+        SC16IS750.write_command(self, 'PMTK220,%d' % (1000 / update_rate))
+        self.update_rate = update_rate
+
+    def epoch_bytes(self):
+        """ typical UART bytes per fix of the subscribed sentences """
+        return sum(self.SENTENCE_BYTES[t] for t in self.sentences)
+
+    def high_rate(self, update_rate=10, baud=57600, timeout=2.0):
+        """ 5/10 Hz mode, the module (PMTK251) and the bridge divisor
+        are switched to baud, the link is verified with PMTK605 and
+        the old baud restored if the module does not answer,
+        the update rate goes up last so the old baud is never flooded,
+        the module keeps the baud until its backup power is lost """
+        if baud not in self.PMTK251_BAUDS:
+            raise ValueError("baud rate not supported")
+        # 10 bits per character, keep 20% headroom
+        if self.epoch_bytes() * update_rate * 10 > 0.8 * baud:
+            raise ValueError("%d baud too slow for %d Hz" % (baud, update_rate))
+        if self.reader is not None and self.reader.is_alive():
+            raise RuntimeError("stop_reader before changing the link")
+
+        old_baud = self.baud
+        SC16IS750.write_command(self, 'PMTK251,%d' % baud)
+        # let the TX FIFO drain at the old baud before switching
+        SC16IS750.flush(self)
+        self.set_baud(baud)
+        if not self.verify_link(timeout):
+            self.set_baud(old_baud)
+            raise IOError("GPS does not answer at %d baud" % baud)
+        self.set_update_rate(update_rate)
+        self.reset_stats()
+
+    def verify_link(self, timeout=2.0):
+        """ send PMTK605, True if the PMTK705 release answer
+        comes back with a good checksum before timeout """
+        SC16IS750.write_sentence(self, self.PMTK_Q_RELEASE)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            sentence = SC16IS750.read_sentence(self, deadline - time.time())
+            if sentence is not None and \
+                    nmea0183.split(sentence, ('MTK705',)) is not None:
+                return True
+        return False
+
+    def reset_stats(self):
+        """ restart the link statistics """
+        self.stats = {'start': time.time(), 'sentences': 0, 'fixes': 0,
+                      'rejected': 0, 'missed': 0, 'i2c_errors': 0}
+        self.aggregator.incomplete = 0
+        self._last_epoch = None
+
+    def link_stats(self):
+        """ link statistics since reset_stats,
+        fixes_per_second: sustained fix rate,
+        rejected: subscribed sentences failing checksum or parsing,
+        incomplete: epochs missing one of the subscribed sentences,
+        missed: epochs missing entirely, from gaps in the fix timestamps,
+        i2c_errors: reads that failed after every retry """
+        stats = dict(self.stats)
+        elapsed = time.time() - stats.pop('start')
+        stats['fixes_per_second'] = stats['fixes'] / elapsed if elapsed > 0 else 0.0
+        stats['incomplete'] = self.aggregator.incomplete
+        return stats
+
+    def _count_fix(self, fix):
+        self.stats['fixes'] += 1
+        epoch = nmea0183.seconds(fix.get('timestamp'))
+        if epoch is not None and self._last_epoch is not None:
+            # modulo a day for the midnight roll over
+            gap = (epoch - self._last_epoch) % 86400
+            self.stats['missed'] += max(int(round(gap * self.update_rate)) - 1, 0)
+        self._last_epoch = epoch
+
+    def output_command(self):
+        """ PMTK314 sentence enabling only the subscribed sentences """
+        fields = ['1' if t in self.sentences else '0'
+                  for t in self.PMTK314_SENTENCES]
+        return nmea0183.build('PMTK314,' + ','.join(fields + ['0'] * 13))
+
     def __str__(self):
         """ read GPS nmea0183 sentences """
         return SC16IS750.read_sentence(self)
 
     def parse_sentence(self):
         """ parse GPS nmea0183 sentences, one shot,
-        currently only support RMC,"""
-        sentence_type = ""
-        while sentence_type is not "RMC":
+        returns the fix merged from the subscribed sentences """
+        fix = None
+        while fix is None:
             sentence = SC16IS750.read_sentence(self)
+            fix = self.parse_fix(sentence)
+        return fix
+
+    def parse_fix(self, sentence):
+        """ parse one nmea0183 sentence, returns the merged fix
+        once every subscribed sentence of the epoch is in, else None,
+        other sentence types and talkers are dropped before checksumming """
+        self.stats['sentences'] += 1
+        data = nmea0183.parse(sentence, self.fix_types, talkers=self.talkers)
+        if data is None:
+            if sentence[3:6] in self.fix_types and \
+                    (self.talkers is None or sentence[1:3] in self.talkers):
+                self.stats['rejected'] += 1
+            return None
+        fix = self.aggregator.add(data)
+        if fix is not None:
+            self._count_fix(fix)
+        return fix
+
+    def start_reader(self, maxlen=64):
+        """ background acquisition, a thread keeps draining the FIFO,
+        the last maxlen sentences are kept in a ring buffer
+        and the newest fix is published for latest_fix,
+        one reader at a time """
+        if self.reader is not None and self.reader.is_alive():
+            raise RuntimeError("reader already running")
+        self.ring = collections.deque(maxlen=maxlen)
+        self._stop_event.clear()
+        self.reset_stats()
+        self.reader = threading.Thread(target=self._read_loop,
+                                       name="GPS_I2C reader")
+        self.reader.daemon = True
+        self.reader.start()
+
+    def stop_reader(self, timeout=2.0):
+        """ stop background acquisition, nothing to do if no reader
+        is running, the thread exits within READ_TIMEOUT even when
+        no sentence arrives, still running after timeout (e.g. a
+        transaction stuck in the driver) it is kept so start_reader
+        refuses to start a second one on the same FIFO """
+        if self.reader is None:
+            return
+        self._stop_event.set()
+        self.reader.join(timeout)
+        if not self.reader.is_alive():
+            self.reader = None
+
+    def _read_loop(self):
+        while not self._stop_event.is_set():
             try:
-                parsed_sentence = pynmea2.parse(sentence)
-            except:
+                sentence = SC16IS750.read_sentence(self, self.READ_TIMEOUT)
+            except I2CError:
+                # complete lines stay in the assembler, a broken one is dropped
+                self.stats['i2c_errors'] += 1
+                time.sleep(self.poll_delay(0))
                 continue
-
-            try:
-                sentence_type = parsed_sentence.sentence_type
-            except AttributeError: # "sentence not supported"
-                # print "#attribute error"
+            if sentence is None:
+                # no sentence yet, check for stop_reader
                 continue
-            latitude = parsed_sentence.latitude
-            longitude = parsed_sentence.longitude
-            lat_dir = parsed_sentence.lat_dir
-            lon_dir = parsed_sentence.lon_dir
-            timestamp = parsed_sentence.timestamp
-            datestamp = parsed_sentence.datestamp
-            spd_over_grnd = parsed_sentence.spd_over_grnd
-            true_course = parsed_sentence.true_course
-            fix = parsed_sentence.is_valid
-            # print fix
-            return({"latitude": latitude,
-                    "longitude": longitude,
-                    "lat_dir": lat_dir,
-                    "lon_dir": lon_dir,
-                    "datetime": datestamp.strftime("%Y-%m-%d ") + timestamp.strftime("%H:%M:%S"),
-                    "spd_over_grnd": spd_over_grnd,
-                    "true_course": true_course,
-                    "fix": fix})
+            stamp = time.time()
+            self.ring.append((stamp, sentence))
+            fix = self.parse_fix(sentence)
+            if fix is not None:
+                with self._fix_lock:
+                    self._fix, self._fix_time = fix, stamp
+                self._fix_event.set()
+
+    def latest_fix(self):
+        """ newest fix from the reader and its age in seconds,
+        (None, None) before the first fix """
+        with self._fix_lock:
+            fix, stamp = self._fix, self._fix_time
+        if fix is None:
+            return None, None
+        return fix, time.time() - stamp
+
+    def wait_fix(self, timeout=None):
+        """ block until the reader has a fix, then as latest_fix """
+        self._fix_event.wait(timeout)
+        return self.latest_fix()
+
+    def recent_sentences(self):
+        """ (time, sentence) pairs in the ring buffer, oldest first """
+        return list(self.ring)
 
 
 if __name__ == "__main__":
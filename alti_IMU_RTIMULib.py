@@ -10,6 +10,11 @@ import RTIMU
 import os.path
 import time
 import math
+import threading
+import numpy
+
+# columns of a sample in the stream ring buffer
+FIELDS = ("time", "roll", "pitch", "yaw", "pressure", "height", "temperature")
 
 def computeHeight(pressure):
     """
@@ -48,6 +53,11 @@ class alti_IMU(object):
         if not os.path.exists(SETTINGS_FILE + ".ini"):
             if not self.quiet: print("#Settings file does not exist, will be created")
         self.s = RTIMU.Settings(SETTINGS_FILE)
+        self._ring_lock = threading.Lock()
+        self._sample_event = threading.Event()
+        self._stop_event = threading.Event()
+        self.streamer = None
+        self.samples = 0
 
     def initialize(self):
         # initialize IMU
@@ -122,20 +132,113 @@ class alti_IMU(object):
                 data["temperatureValid"], data["temperature"]) =\
                 self.pressure.pressureRead()
 
-                fusionPose = data["fusionPose"]
-
                 # time.sleep(1)
                 time.sleep(self.poll_interval*1.0/1000.0)
                 tdf = time.time() - tic
                 # print tdf
         else:
             # print data["pressure"]
-            return {"pressure": data["pressure"],
-                    "height": computeHeight(data["pressure"]),
-                    "temperature": data["temperature"],
-                    "roll": reverseRoll(math.degrees(fusionPose[0]))-self.offset[0],
-                    "pitch": math.degrees(fusionPose[1])-self.offset[1],
-                    "yaw": math.degrees(fusionPose[2])}
+            return self.convert(data)
+
+    def convert(self, data):
+        """ roll, pitch, yaw in degrees, height and pressure of
+        the RTIMU data of one read """
+        fusionPose = data["fusionPose"]
+        return {"pressure": data["pressure"],
+                "height": computeHeight(data["pressure"]),
+                "temperature": data["temperature"],
+                "roll": reverseRoll(math.degrees(fusionPose[0]))-self.offset[0],
+                "pitch": math.degrees(fusionPose[1])-self.offset[1],
+                "yaw": math.degrees(fusionPose[2])}
+
+    def start_stream(self, size=1024):
+        """ continuous sampling, a thread polls the IMU every
+        IMUGetPollInterval so the fusion sees every sample, the last
+        size samples are kept in a ring buffer for latest and window,
+        one stream at a time """
+        if self.streamer is not None and self.streamer.is_alive():
+            raise RuntimeError("stream already running")
+        self.ring = numpy.full((size, len(FIELDS)), numpy.nan)
+        self.samples = 0
+        self.stats = {"samples": 0, "misses": 0, "errors": 0, "last_error": None}
+        self._stop_event.clear()
+        self._sample_event.clear()
+        self.streamer = threading.Thread(target=self._stream_loop,
+                                         name="alti_IMU stream")
+        self.streamer.daemon = True
+        self.streamer.start()
+
+    def stop_stream(self, timeout=2.0):
+        """ stop continuous sampling, the thread exits after
+        the poll interval it is sleeping, nothing to do if no
+        stream is running """
+        if self.streamer is None:
+            return
+        self._stop_event.set()
+        self.streamer.join(timeout)
+        if not self.streamer.is_alive():
+            self.streamer = None
+
+    def _stream_loop(self):
+        period = self.poll_interval * 1.0 / 1000.0
+        row = numpy.empty(len(FIELDS))
+        while not self._stop_event.is_set():
+            try:
+                if self.imu.IMURead():
+                    data = self.imu.getIMUData()
+                    (data["pressureValid"], data["pressure"],\
+                    data["temperatureValid"], data["temperature"]) =\
+                    self.pressure.pressureRead()
+                    sample = self.convert(data)
+                else:
+                    sample = None
+            except (IOError, ValueError) as err:
+                # a failed read or a reading convert cannot take (e.g.
+                # a garbage pressure) must not end the stream, the
+                # caller sees it as a growing age of latest, the cause
+                # in stats, anything else is a bug and ends the stream
+                self.stats["errors"] += 1
+                self.stats["last_error"] = err
+                time.sleep(period)
+                continue
+            if sample is not None:
+                sample["time"] = time.time()
+                row[:] = [sample[field] for field in FIELDS]
+                with self._ring_lock:
+                    self.ring[self.samples % len(self.ring)] = row
+                    self.samples += 1
+                self.stats["samples"] += 1
+                self._sample_event.set()
+            else:
+                self.stats["misses"] += 1
+            time.sleep(period)
+
+    def latest(self):
+        """ newest sample of the stream as read_data returns it,
+        plus its time, and its age in seconds, (None, None) before
+        the first sample """
+        with self._ring_lock:
+            if not self.samples:
+                return None, None
+            row = self.ring[(self.samples - 1) % len(self.ring)].copy()
+        sample = dict(zip(FIELDS, row.tolist()))
+        return sample, time.time() - sample["time"]
+
+    def wait_sample(self, timeout=None):
+        """ block until the stream has a sample, then as latest """
+        self._sample_event.wait(timeout)
+        return self.latest()
+
+    def window(self, seconds=None):
+        """ copy of the samples of the last seconds (all in the ring
+        by default), oldest first, one row per sample, columns FIELDS """
+        with self._ring_lock:
+            count = min(self.samples, len(self.ring))
+            end = self.samples % len(self.ring)
+            rows = numpy.roll(self.ring, -end, axis=0)[len(self.ring) - count:]
+        if seconds is not None:
+            rows = rows[rows[:, 0] >= time.time() - seconds]
+        return rows
 
 
 if __name__ == "__main__":
@@ -0,0 +1,250 @@
+#! /usr/bin/python
+""" lightweight NMEA0183 parser for the sentences used on the boat,
+GPS: RMC, GGA, GSA
+WX200: MWV, MDA, HDG
+sentences are filtered by type before anything else is done,
+then checksummed and split into a dict of fields,
+field names follow pynmea2 """
+
+import operator
+
+
+def _float(value):
+    """ float of a field, None if the field is empty """
+    return float(value) if value else None
+
+
+def _int(value):
+    """ int of a field, None if the field is empty """
+    return int(value) if value else None
+
+
+def _str(value):
+    return value
+
+
+def dm_to_sd(dm):
+    """ dddmm.mmmm to decimal degrees """
+    if not dm or dm == '0':
+        return 0.0
+    dot = dm.find('.')
+    if dot < 0:
+        dot = len(dm)
+    return int(dm[:dot - 2]) + float(dm[dot - 2:]) / 60
+
+
+def signed_degrees(dm, direction):
+    """ decimal degrees, negative to the S and W """
+    value = dm_to_sd(dm)
+    return -value if direction in ('S', 'W') else value
+
+
+def format_time(timestamp):
+    """ hhmmss.sss to HH:MM:SS, None if empty """
+    if len(timestamp) < 6:
+        return None
+    return timestamp[0:2] + ':' + timestamp[2:4] + ':' + timestamp[4:6]
+
+
+def seconds(timestamp):
+    """ hhmmss.sss to seconds of the day, None if empty """
+    if not timestamp or len(timestamp) < 6:
+        return None
+    return int(timestamp[0:2]) * 3600 + int(timestamp[2:4]) * 60 + \
+        float(timestamp[4:])
+
+
+def format_date(datestamp):
+    """ ddmmyy to YYYY-MM-DD, None if empty,
+    two digit years as strptime's %y """
+    if len(datestamp) != 6:
+        return None
+    year = int(datestamp[4:6])
+    year += 1900 if year >= 69 else 2000
+    return '%d-%s-%s' % (year, datestamp[2:4], datestamp[0:2])
+
+
+def checksum(data):
+    """ xor of the characters between $ and * """
+    return reduce(operator.xor, bytearray(data), 0)
+
+
+def build(body):
+    """ sentence of a body without $ and *XX, e.g. 'PMTK605' """
+    return '$%s*%02X\r\n' % (body, checksum(body))
+
+
+# field names and converters of each sentence type
+FIELDS = {
+    'RMC': (('timestamp', _str), ('status', _str),
+            ('lat', _str), ('lat_dir', _str),
+            ('lon', _str), ('lon_dir', _str),
+            ('spd_over_grnd', _float), ('true_course', _float),
+            ('datestamp', _str),
+            ('mag_variation', _float), ('mag_var_dir', _str),
+            ('mode_indicator', _str)),
+    'GGA': (('timestamp', _str),
+            ('lat', _str), ('lat_dir', _str),
+            ('lon', _str), ('lon_dir', _str),
+            ('gps_qual', _int), ('num_sats', _int),
+            ('horizontal_dil', _float),
+            ('altitude', _float), ('altitude_units', _str),
+            ('geo_sep', _float), ('geo_sep_units', _str),
+            ('age_gps_data', _float), ('ref_station_id', _str)),
+    'GSA': (('mode', _str), ('mode_fix_type', _int)) +
+           tuple(('sv_id%02d' % i, _str) for i in range(1, 13)) +
+           (('pdop', _float), ('hdop', _float), ('vdop', _float)),
+    'MWV': (('wind_angle', _float), ('reference', _str),
+            ('wind_speed', _float), ('wind_speed_units', _str),
+            ('status', _str)),
+    'MDA': (('b_pressure_inch', _float), ('inches', _str),
+            ('b_pressure_bar', _float), ('bars', _str),
+            ('air_temp', _float), ('a_celsius', _str),
+            ('water_temp', _float), ('w_celsius', _str),
+            ('rel_humidity', _float), ('abs_humidity', _float),
+            ('dew_point', _float), ('d_celsius', _str),
+            ('direction_true', _float), ('true', _str),
+            ('direction_magnetic', _float), ('magnetic', _str),
+            ('wind_speed_knots', _float), ('knots', _str),
+            ('wind_speed_meters', _float), ('meters', _str)),
+    'HDG': (('heading', _float),
+            ('deviation', _float), ('dev_dir', _str),
+            ('variation', _float), ('var_dir', _str)),
+}
+
+GPS_TYPES = ('RMC', 'GGA', 'GSA')
+WX200_TYPES = ('MWV', 'MDA', 'HDG')
+
+
+def _position(data):
+    data['latitude'] = signed_degrees(data['lat'], data['lat_dir'])
+    data['longitude'] = signed_degrees(data['lon'], data['lon_dir'])
+
+
+def _RMC(data):
+    _position(data)
+    date, time = format_date(data['datestamp']), format_time(data['timestamp'])
+    data['datetime'] = date + ' ' + time if date and time else None
+    data['fix'] = data['status'] == 'A'
+
+
+def _GGA(data):
+    _position(data)
+    data['fix'] = bool(data['gps_qual'])
+
+
+def _GSA(data):
+    data['fix'] = (data['mode_fix_type'] or 0) >= 2
+
+
+# derived fields, after the raw fields are converted
+DERIVED = {'RMC': _RMC, 'GGA': _GGA, 'GSA': _GSA}
+
+
+def split(sentence, types=None, check=True, talkers=None):
+    """ (talker, type, fields) of a sentence,
+    None if its type is not in types, its talker (e.g. 'GP', 'GN')
+    not in talkers, it is malformed, or check is set and the
+    checksum is missing or wrong """
+    if sentence[:1] != '$':
+        return None
+    # talker and type are filtered before the checksum, proprietary
+    # sentences ($P...) have a one letter talker
+    if sentence[1:2] == 'P':
+        talker, sentence_type = 'P', sentence[2:].split(',', 1)[0]
+    else:
+        talker, sentence_type = sentence[1:3], sentence[3:6]
+    if types is not None and sentence_type not in types:
+        return None
+    if talkers is not None and talker not in talkers:
+        return None
+
+    star = sentence.rfind('*')
+    if star < 0:
+        if check:
+            return None
+        body = sentence[1:].rstrip('\r\n')
+    else:
+        body = sentence[1:star]
+        if check:
+            try:
+                if int(sentence[star + 1:star + 3], 16) != checksum(body):
+                    return None
+            except ValueError:
+                return None
+    return talker, sentence_type, body.split(',')[1:]
+
+
+def parse(sentence, types=None, check=True, talkers=None):
+    """ dict of a sentence, with 'talker' and 'type',
+    None if split rejects it or the type has no FIELDS,
+    missing trailing fields are None """
+    result = split(sentence, types, check, talkers)
+    if result is None:
+        return None
+    talker, sentence_type, fields = result
+    try:
+        names = FIELDS[sentence_type]
+    except KeyError:
+        return None
+
+    data = {'talker': talker, 'type': sentence_type}
+    try:
+        for (name, convert), value in map(None, names, fields[:len(names)]):
+            data[name] = convert(value) if value is not None else None
+        derive = DERIVED.get(sentence_type)
+        if derive is not None:
+            derive(data)
+    except (ValueError, TypeError):
+        return None
+    return data
+
+
+class FixAggregator(object):
+    """ merge the parsed sentences of one GPS epoch into one fix,
+    RMC and GGA are matched on their timestamp, GSA has none and
+    joins the epoch being assembled (the MTK chip sends it after GGA),
+    fields of later sentences win, fix is only True if every
+    sentence of the epoch says so """
+
+    def __init__(self, types=('RMC', 'GGA')):
+        self.types = frozenset(types)
+        self.incomplete = 0  # epochs dropped before all types arrived
+        self._reset()
+
+    def _reset(self):
+        self.epoch = None
+        self.fix = {}
+        self.seen = set()
+
+    def add(self, data):
+        """ add one parsed sentence,
+        returns the merged fix once every type of the epoch is in """
+        sentence_type = data['type']
+        if sentence_type not in self.types:
+            return None
+        stamp = data.get('timestamp')
+        if stamp is not None:
+            if self.epoch is not None and stamp != self.epoch:
+                # next epoch started before this one completed
+                self.incomplete += 1
+                self._reset()
+            self.epoch = stamp
+
+        valid = self.fix.get('fix', True) and data['fix']
+        self.fix.update(data)
+        self.fix['fix'] = valid
+        self.seen.add(sentence_type)
+        if self.seen != self.types:
+            return None
+
+        fix = self.fix
+        fix['type'] = ','.join(sorted(self.seen))
+        self._reset()
+        return fix
+
+
+if __name__ == "__main__":
+    import sys
+    for line in open(sys.argv[1]):
+        print parse(line)
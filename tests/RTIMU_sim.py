@@ -0,0 +1,119 @@
+#! /usr/bin/python
+""" simulated RTIMU module for runs and benchmarks without the
+RTIMULib python binding and the AltIMU on the bus,
+RTIMU fuses a pose that turns slowly in yaw, every miss-th
+IMURead has no new sample as the real fusion between polls,
+RTPressure reads a fixed pressure and temperature,
+failures can be injected into the reads of either
+
+    import RTIMU_sim
+    RTIMU_sim.install()
+    import alti_IMU_RTIMULib
+    IMU = alti_IMU_RTIMULib.alti_IMU(isoffset=False, quiet=True)
+    IMU.initialize()
+    IMU.imu.fail_next(3)
+"""
+
+import sys
+import math
+import time
+
+
+class Settings(object):
+    """ RTIMU.Settings stand-in, nothing is read or written """
+
+    def __init__(self, name):
+        self.name = name
+
+
+class RTIMU(object):
+    """ RTIMU.RTIMU stand-in, poll_interval in ms as
+    IMUGetPollInterval reports it, yaw_rate in degrees a second """
+
+    def __init__(self, settings, poll_interval=4, miss=5, yaw_rate=10.0):
+        self.settings = settings
+        self.poll_interval = poll_interval
+        self.miss = miss
+        self.yaw_rate = yaw_rate
+        self.reads = 0
+        self.failures = 0
+        self.start = time.time()
+
+    def IMUName(self):
+        return "simulated IMU"
+
+    def IMUInit(self):
+        return True
+
+    def setSlerpPower(self, power):
+        pass
+
+    def setGyroEnable(self, enable):
+        pass
+
+    def setAccelEnable(self, enable):
+        pass
+
+    def setCompassEnable(self, enable):
+        pass
+
+    def IMUGetPollInterval(self):
+        return self.poll_interval
+
+    def fail_next(self, count=1):
+        """ the next count IMURead raise IOError """
+        self.failures += count
+
+    def IMURead(self):
+        self.reads += 1
+        if self.failures:
+            self.failures -= 1
+            raise IOError("simulated IMU read failure")
+        return bool(self.reads % self.miss)
+
+    def getIMUData(self):
+        # level and upright (roll reads 180 before reverseRoll)
+        elapsed = time.time() - self.start
+        yaw = math.radians((self.yaw_rate * elapsed + 180) % 360 - 180)
+        return {"fusionPose": (math.pi, 0.0, yaw),
+                "timestamp": int(elapsed * 1e6)}
+
+
+class RTPressure(object):
+    """ RTIMU.RTPressure stand-in, pressure in hPa, temperature in C """
+
+    def __init__(self, settings, pressure=1000.0, temperature=20.0):
+        self.settings = settings
+        self.pressure = pressure
+        self.temperature = temperature
+        self.failures = 0
+        self.garbled = 0
+
+    def pressureName(self):
+        return "simulated pressure sensor"
+
+    def pressureInit(self):
+        return True
+
+    def fail_next(self, count=1):
+        """ the next count pressureRead raise IOError """
+        self.failures += count
+
+    def garble_next(self, count=1):
+        """ the next count pressureRead return a negative pressure,
+        as from a corrupted read, which computeHeight cannot take """
+        self.garbled += count
+
+    def pressureRead(self):
+        if self.failures:
+            self.failures -= 1
+            raise IOError("simulated pressure read failure")
+        if self.garbled:
+            self.garbled -= 1
+            return True, -self.pressure, True, self.temperature
+        return True, self.pressure, True, self.temperature
+
+
+def install():
+    """ import RTIMU gets this module from now on """
+    sys.modules["RTIMU"] = sys.modules[__name__]
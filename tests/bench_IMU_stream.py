@@ -0,0 +1,93 @@
+#! /usr/bin/python
+""" benchmark the alti_IMU sample stream on the simulated RTIMU,
+the sample rate against the poll interval, latest and window
+against the ring buffer after it wrapped around, reads failing
+in IMURead, pressureRead and convert counted without ending the
+stream, and the age of latest growing once the stream stops """
+
+import sys
+import os.path
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import RTIMU_sim
+RTIMU_sim.install()
+
+from alti_IMU_RTIMULib import alti_IMU, FIELDS
+
+
+def timeit(func, repeat=2000):
+    tic = time.time()
+    for i in range(repeat):
+        func()
+    return (time.time() - tic) * 1e6 / repeat
+
+
+def check_ring(IMU, size):
+    """ window is the last size samples in order, its newest is latest """
+    rows = IMU.window()
+    sample, age = IMU.latest()
+    times = rows[:, FIELDS.index("time")]
+    assert len(rows) == min(IMU.samples, size)
+    assert (times[1:] > times[:-1]).all()
+    assert times[-1] == sample["time"]
+    return rows
+
+
+if __name__ == "__main__":
+    IMU = alti_IMU(isoffset=False, quiet=True)
+    IMU.initialize()
+    assert IMU.latest() == (None, None)
+    # nothing to stop yet
+    IMU.stop_stream()
+
+    size = 64
+    IMU.start_stream(size)
+    sample, age = IMU.wait_sample(1.0)
+    assert sample is not None and age < 0.1
+    assert abs(sample["roll"]) < 1e-6 and sample["pressure"] == 1000.0
+    # one poller per ring
+    try:
+        IMU.start_stream(size)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("a second stream started")
+
+    # a second of samples, more than the ring holds
+    time.sleep(1.0)
+    rows = check_ring(IMU, size)
+    stats = dict(IMU.stats)
+    print "%d samples, %d misses in 1 s at a %d ms poll interval, ring of %d" % (
+        stats["samples"], stats["misses"], IMU.poll_interval, size)
+    assert IMU.samples > size and len(rows) == size
+    recent = IMU.window(0.1)
+    assert 0 < len(recent) < size and \
+        (recent[:, 0] >= time.time() - 0.1 - IMU.poll_interval / 1e3).all()
+    print "window(0.1): %d rows, yaw %.1f to %.1f" % (
+        len(recent), recent[0, FIELDS.index("yaw")], recent[-1, FIELDS.index("yaw")])
+    print "latest %.1f us, window() %.1f us, window(0.1) %.1f us" % (
+        timeit(IMU.latest), timeit(IMU.window), timeit(lambda: IMU.window(0.1)))
+
+    # failures in each stage of a read, the stream goes on
+    IMU.imu.fail_next(3)
+    IMU.pressure.fail_next(2)
+    IMU.pressure.garble_next(4)
+    samples = IMU.samples
+    time.sleep(0.3)
+    check_ring(IMU, size)
+    assert IMU.stats["errors"] == 9 and IMU.samples > samples
+    assert IMU.streamer.is_alive()
+    # the garbled pressures failed last, in computeHeight
+    assert isinstance(IMU.stats["last_error"], ValueError)
+    print "9 failed reads: %d errors counted, %d samples since, last: %r" % (
+        IMU.stats["errors"], IMU.samples - samples, IMU.stats["last_error"])
+
+    # a stalled stream, latest keeps its last sample and ages
+    IMU.stop_stream()
+    IMU.stop_stream()
+    time.sleep(0.3)
+    sample, age = IMU.latest()
+    assert age > 0.3
+    print "stopped: latest is %.2f s old" % age
@@ -0,0 +1,254 @@
+#! /usr/bin/python
+""" benchmark LCD_I2C refreshes on the simulated backpack,
+the toplevel status screen (time, position, attitude, distance and
+bearing) updated once a second for a minute, every line rewritten in
+full as the old send_string did, against the diffed frame refresh,
+then a 50Hz control loop updating the screen every iteration,
+refreshed in the loop against the refresher thread at 5Hz,
+the character throughput of send_byte per character against
+the packed block writes, the port bytes of a screen shifted per
+character against the nibble tables, the CGRAM uploads of a
+bearing arrow and throttle bar updated every second, and refreshes
+through late faults that cut block writes short, blindly retried
+against resynced """
+
+import sys
+import os.path
+import time
+import math
+import itertools
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import I2C_sim
+from Adafruit_I2C import Adafruit_I2C, I2CError
+
+sim = I2C_sim.install(busnum=1)
+model = sim.attach(0x3f, I2C_sim.PCF8574LCDModel())
+
+from LCD_I2C import LCD_I2C, ARROWS
+
+
+def old_send_string(lcd, message, line):
+    "the old send_string, address and every character of the line"
+    message = message.ljust(lcd.width, " ")
+    lcd.send_byte((lcd.LCD_LINE_1, lcd.LCD_LINE_2, lcd.LCD_LINE_3, lcd.LCD_LINE_4)[line - 1],
+                  lcd.LCD_CMD)
+    for i in range(lcd.width):
+        lcd.send_byte(ord(message[i]), lcd.LCD_CHR)
+
+
+def old_nibbles(lcd, data, mode):
+    "port bytes shifted per character, as before the nibble tables"
+    port = bytearray()
+    backlight = mode | lcd.LCD_BACKLIGHT
+    for bits in data:
+        high = backlight | (bits & 0xF0)
+        low = backlight | ((bits << 4) & 0xF0)
+        port.extend((high, high | lcd.ENABLE, high,
+                     low, low | lcd.ENABLE, low))
+    return port
+
+
+def blind_write_port(lcd, port):
+    "packed blocks retried whole, as before the resync"
+    with lcd.transaction():
+        for start in range(0, len(port), lcd.BLOCK):
+            Adafruit_I2C.writeRawList(lcd, port[start:start + lcd.BLOCK])
+
+
+def screens(count=60):
+    "the toplevel status lines of a boat under way, one per second"
+    for i in range(count):
+        lat = 40.5 + i * 1e-5
+        lon = -73.9 + i * 2e-5
+        yaw = 80 + 5 * math.sin(i / 10.0)
+        yield ["2016-05-01 12:%02d:%02d" % (i // 60, i % 60),
+               "%.4f%s,%.4f%s" % (lat, 'N', -lon, 'W'),
+               "p:%.1f,r:%.1f,y:%.1f" % (1.5 + 0.1 * (i % 3), -0.5, yaw),
+               "%.1f,%.1f" % (12000 - 1.8 * i, yaw - 60)]
+
+
+def bench(lcd, update, count=60):
+    sim.reset_counters()
+    writes = model.writes
+    tic = time.time()
+    for lines in screens(count):
+        update(lines)
+        assert model.text() == \
+            [line[:lcd.width].ljust(lcd.width) for line in lines]
+    toc = time.time()
+    return ((model.writes - writes) / float(count), sim.transactions / float(count),
+            sim.bus_time * 1e3 / count, (toc - tic) * 1e3 / count)
+
+
+def full(lcd):
+    def update(lines):
+        for number, line in enumerate(lines, 1):
+            old_send_string(lcd, line, number)
+    return update
+
+
+def diffed(lcd, packed):
+    def update(lines):
+        lcd.PACKED = packed
+        for number, line in enumerate(lines, 1):
+            lcd.set_line(line, number)
+        lcd.refresh()
+    return update
+
+
+if __name__ == "__main__":
+    lcd = LCD_I2C(0x3f, busnum=1)
+    lcd.initialize()
+
+    for timing in ("default", "no sleep"):
+        if timing == "no sleep":
+            lcd.E_PULSE = lcd.E_DELAY = 0
+        print "E timing: %s" % timing
+        print "%-10s %10s %10s %10s %10s" % ("refresh", "writes", "trans", "bus ms", "ms")
+        ms = {}
+        for name, update in (("full", full(lcd)), ("diffed", diffed(lcd, False)),
+                             ("packed", diffed(lcd, True))):
+            lcd.clear_screen()
+            model.reset()
+            lcd.reset_stats()
+            result = bench(lcd, update, 20)
+            ms[name] = result[3]
+            if name == "diffed":
+                stats = lcd.refresh_stats()
+            print "%-10s %10.1f %10.1f %10.2f %10.2f" % ((name,) + result)
+        # the time saved is measured, full against diffed per refresh
+        print "diffed: %.1f of %d bytes per refresh, %.0f%% saved, %.1f ms saved per refresh" % (
+            stats['sends_per_refresh'], stats['full_sends'] / stats['refreshes'],
+            100 * stats['saved'], ms['full'] - ms['diffed'])
+        print
+
+    # the loop only pays for set_line while the refresher runs
+    lcd.E_PULSE = lcd.E_DELAY = LCD_I2C.E_DELAY
+    lcd.PACKED = LCD_I2C.PACKED
+    print "%-10s %10s %12s %12s" % ("50Hz loop", "refreshes", "loop max ms", "loop avg ms")
+    for name in ("in loop", "refresher"):
+        lcd.clear_screen()
+        lcd.reset_stats()
+        if name == "refresher":
+            lcd.start_refresher(rate=5)
+        worst = total = 0.0
+        count = 0
+        deadline = time.time()
+        for lines in itertools.islice(screens(1000), 100):
+            tic = time.time()
+            for number, line in enumerate(lines, 1):
+                lcd.set_line(line, number)
+            if name == "in loop":
+                lcd.refresh()
+            spent = time.time() - tic
+            worst, total, count = max(worst, spent), total + spent, count + 1
+            deadline += 0.02
+            time.sleep(max(deadline - time.time(), 0))
+        if name == "refresher":
+            time.sleep(0.5)
+            try:
+                lcd.start_refresher(rate=5)
+            except RuntimeError:
+                pass
+            else:
+                raise AssertionError("a second refresher started")
+            lcd.stop_refresher()
+            lcd.stop_refresher()
+        assert model.text() == [line[:lcd.width].ljust(lcd.width) for line in lines]
+        print "%-10s %10d %12.2f %12.2f" % (name, lcd.stats['refreshes'],
+                                            worst * 1e3, total * 1e3 / count)
+
+    # characters per second of whole lines, the wire time of the
+    # simulated bus added to the time spent in Python and sleeping
+    print
+    print "%-18s %10s %10s %10s" % ("throughput", "trans", "bus ms", "chars/s")
+    text = bytearray("0123456789abcdefghij")
+    for name, packed, delay in (("send_byte", False, LCD_I2C.E_DELAY),
+                                ("send_byte no sleep", False, 0),
+                                ("packed", True, 0)):
+        lcd.PACKED = packed
+        lcd.E_PULSE = lcd.E_DELAY = delay
+        repeat = 5 if delay else 50
+        lcd.clear_screen()
+        sim.reset_counters()
+        tic = time.time()
+        for i in range(repeat):
+            for base in lcd.line_addr:
+                lcd.send_bytes((lcd.LCD_SETDDRAMADDR | base,), lcd.LCD_CMD)
+                lcd.send_bytes(text, lcd.LCD_CHR)
+        spent = time.time() - tic + sim.bus_time
+        assert model.text() == [str(text)] * 4
+        print "%-18s %10.0f %10.2f %10.0f" % (name, sim.transactions / float(repeat),
+                                              sim.bus_time * 1e3 / repeat,
+                                              repeat * 4 * len(text) / spent)
+
+    # encoding a 20x4 screen
+    print
+    screen = bytearray("".join(next(screens(1))).ljust(80))
+    assert old_nibbles(lcd, screen, lcd.LCD_CHR) == lcd.nibbles(screen, lcd.LCD_CHR)
+    repeat = 2000
+    tic = time.time()
+    for i in xrange(repeat):
+        old_nibbles(lcd, screen, lcd.LCD_CHR)
+    old = time.time() - tic
+    tic = time.time()
+    for i in xrange(repeat):
+        lcd.nibbles(screen, lcd.LCD_CHR)
+    new = time.time() - tic
+    print "encode 80 chars: shifted %.1f us, table %.1f us" % (old * 1e6 / repeat, new * 1e6 / repeat)
+
+    # a minute of bearing arrow and throttle bar, glyphs from CGRAM
+    lcd.clear_screen()
+    lcd.reset_stats()
+    for i in range(60):
+        bearing = 120 * math.sin(i / 10.0)
+        throttle = 0.5 + 0.3 * math.sin(i / 7.0)
+        # glyphs only pick a slot, the refresh uploads them
+        sim.reset_counters()
+        arrow = lcd.bearing_arrow(bearing)
+        bar = lcd.bar(throttle, 10)
+        assert sim.transactions == 0
+        lcd.set_line("brg %4.0f %s" % (bearing, arrow), 3)
+        lcd.set_line("thr %s" % bar, 4)
+        lcd.refresh()
+        slot = ord(arrow)
+        assert tuple(model.cgram[slot * 8:slot * 8 + 8]) == ARROWS[int(round(bearing / 45.0)) % 8]
+        assert model.text()[2] == ("brg %4.0f %s" % (bearing, arrow)).ljust(lcd.width)
+        assert model.text()[3] == ("thr %s" % bar).ljust(lcd.width)
+    print "60 screens with arrow and bar: %d glyph uploads, %d slots used" % (
+        lcd.stats['glyph_uploads'], len(lcd.glyphs))
+
+    # late faults latch part of a block, the nibbles already clocked in
+    # shift the 4 bit phase, a whole block sent again makes it worse
+    print
+    lcd.PACKED = True
+    for name in ("blind retry", "resync"):
+        if name == "blind retry":
+            lcd.write_port = lambda port: blind_write_port(lcd, port)
+        lcd.clear_screen()
+        lcd.reset_stats()
+        sim.fail_rate(0.05, addr=0x3f, seed=3, late=True)
+        errors = 0
+        for lines in screens(200):
+            for number, line in enumerate(lines, 1):
+                lcd.set_line(line, number)
+            try:
+                lcd.refresh()
+            except I2CError:
+                errors += 1
+        sim.fail_rate(0)
+        lcd.refresh()
+        wanted = [line[:lcd.width].ljust(lcd.width) for line in lines]
+        wrong = sum(got != line for got, line in zip(model.text(), wanted))
+        print "%-12s 200 refreshes at 5%% late faults: %d I2CError, %d resyncs, %d lines wrong" % (
+            name, errors, lcd.stats['resyncs'], wrong)
+        if name == "blind retry":
+            del lcd.write_port
+            lcd.resync()
+        else:
+            # and CGRAM uploaded again after every resync
+            assert wrong == 0 and all(
+                tuple(model.cgram[slot * 8:slot * 8 + 8]) == rows
+                for slot, rows in enumerate(lcd.glyphs))
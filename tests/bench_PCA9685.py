@@ -0,0 +1,159 @@
+#! /usr/bin/python
+""" benchmark PCA9685PW channel writes on the simulated bus,
+rudder and throttle (channels 6 and 7) updated with the old four
+write8 per channel, with one auto-increment block per channel,
+and with one setPWMBatch block for both,
+then the writes of a 50Hz control loop through the shadow cache,
+and the calibrated tick tables against the old per call float math """
+
+import sys
+import os.path
+import time
+import math
+import random
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import I2C_sim
+
+sim = I2C_sim.install()
+model = sim.attach(0x40, I2C_sim.PCA9685Model())
+
+from PCA9685PW import PCA9685PW
+
+LED0_ON_L = 0x06
+
+
+def old_setPWM(pwm, channel, on, off):
+    "the old setPWM, one write8 per register"
+    with pwm.i2c.transaction():
+        pwm.i2c.write8(LED0_ON_L+4*channel, on & 0xFF)
+        pwm.i2c.write8(LED0_ON_L+1+4*channel, on >> 8)
+        pwm.i2c.write8(LED0_ON_L+2+4*channel, off & 0xFF)
+        pwm.i2c.write8(LED0_ON_L+3+4*channel, off >> 8)
+
+
+def old_pulse(freq, pulse):
+    "the old setServoPulse arithmetic"
+    pulseLength = 1000000 / float(freq) / 4096.0
+    return int(pulse * 1000 / pulseLength)
+
+
+def old_angle_ticks(pwm, angle):
+    "the old setServoAngle, through setServoPulse"
+    if 0 <= angle <= 90:
+        pulse = 1.5 + angle * (2.5 - 1.5) / 90
+    elif -90 <= angle < 0:
+        pulse = 1.5 - angle * (0.5 - 1.5) / 90
+    return old_pulse(pwm.freq, pulse)
+
+
+def old_throttle_ticks(pwm, throttle):
+    "the old setServoThrottle, reverse divided by 90"
+    if 0 <= throttle <= 100:
+        thrust = 1.5 + throttle * (2.5 - 1.5) / 100
+    elif -100 <= throttle < 0:
+        thrust = 1.5 - throttle * (0.5 - 1.5) / 90
+    return old_pulse(pwm.freq, thrust)
+
+
+def control_loop(pwm, seconds=60, rate=50):
+    """ rudder angle commands of a boat holding a slowly turning
+    course, with sensor noise on the heading error """
+    noise = random.Random(1)
+    pwm.resetWriteStats()
+    sim.reset_counters()
+    for i in range(seconds * rate):
+        t = float(i) / rate
+        angle = 20 * math.sin(2 * math.pi * t / 30) + noise.gauss(0, 0.3)
+        pwm.setServoAngle(6, int(round(angle)))
+        pwm.setServoThrottle(7, 40)
+    return pwm.writeStats(), sim.bus_time
+
+
+def bench(update, count=5000):
+    sim.reset_counters()
+    tic = time.time()
+    for i in range(count):
+        update(200 + i % 200)
+    toc = time.time()
+    return (sim.transactions * 1.0 / count, sim.bus_time * 1e3 / count,
+            (toc - tic) * 1e6 / count)
+
+
+if __name__ == "__main__":
+    pwm = PCA9685PW(0x40, quiet=True)
+    pwm.setPWMFreq(50)
+
+    print "%-10s %12s %14s %14s" % ("update", "trans", "bus ms", "cpu us")
+    for name, update in (
+            ("write8", lambda off: (old_setPWM(pwm, 6, 0, off),
+                                    old_setPWM(pwm, 7, 0, 600 - off))),
+            ("setPWM", lambda off: (pwm.setPWM(6, 0, off),
+                                    pwm.setPWM(7, 0, 600 - off))),
+            ("batch", lambda off: pwm.setPWMBatch({6: (0, off), 7: (0, 600 - off)}))):
+        result = bench(update)
+        assert model.channel(6) == (0, 399) and model.channel(7) == (0, 201)
+        print "%-10s %12.1f %14.3f %14.1f" % ((name,) + result)
+
+    # all 16 channels, two blocks of 8
+    sim.reset_counters()
+    pwm.setPWMBatch(dict((channel, (0, 100 + channel)) for channel in range(16)))
+    assert [model.channel(c) for c in range(16)] == [(0, 100 + c) for c in range(16)]
+    print "16 channels: %d transactions" % sim.transactions
+    # 2 of 8 batched channels changed, stats counted in channels
+    pwm.resetWriteStats()
+    pwm.setPWMBatch(dict((channel, (0, 100 + channel + (channel in (2, 3))))
+                         for channel in range(8)))
+    stats = pwm.writeStats()
+    assert (stats['writes'], stats['channels'], stats['skipped']) == (1, 2, 6)
+    print "batch of 8, 2 changed: %(writes)d write, %(channels)d channels, " \
+        "%(skipped)d skipped, %(saved).0f%% saved" % dict(stats, saved=100 * stats['saved'])
+
+    for freq in (50, 60, 200):
+        pwm.setPWMFreq(freq)
+        for pulse in range(500, 2501):
+            assert old_pulse(freq, pulse / 1000.0) == int(pulse / 1000.0 * 1000 * pwm.ticksPerUs)
+
+    # 60s of a 50Hz loop commanding rudder and throttle every iteration
+    pwm.setPWMFreq(50)
+    print
+    print "%-10s %8s %8s %8s %8s %10s" % ("deadband", "updates", "channels", "writes",
+                                          "saved", "bus ms/s")
+    # a negative deadband never matches, every update is written
+    for deadband in (-1, 0, 2):
+        pwm.deadband = deadband
+        stats, bus_time = control_loop(pwm)
+        print "%-10s %8d %8d %8d %7.1f%% %10.2f" % (
+            "no cache" if deadband < 0 else deadband,
+            stats['channels'] + stats['skipped'], stats['channels'],
+            stats['writes'], 100 * stats['saved'], bus_time * 1e3 / 60)
+
+    # calibrated tables, same counts as the old math except reverse throttle
+    print
+    angle = pwm.profile(6, 'angle')
+    throttle = pwm.profile(7, 'throttle')
+    assert [angle.ticks(a) for a in range(-90, 91)] == \
+        [old_angle_ticks(pwm, a) for a in range(-90, 91)]
+    assert [throttle.ticks(t) for t in range(0, 101)] == \
+        [old_throttle_ticks(pwm, t) for t in range(0, 101)]
+    print "throttle -100: old %d ticks (%.3f ms), now %d ticks (%.3f ms)" % (
+        old_throttle_ticks(pwm, -100), old_throttle_ticks(pwm, -100) / pwm.ticksPerUs / 1e3,
+        throttle.ticks(-100), throttle.ticks(-100) / pwm.ticksPerUs / 1e3)
+    repeat = 100000
+    tic = time.time()
+    for i in xrange(repeat):
+        old_angle_ticks(pwm, i % 181 - 90)
+    old = time.time() - tic
+    tic = time.time()
+    for i in xrange(repeat):
+        angle.ticks(i % 181 - 90)
+    new = time.time() - tic
+    print "angle to ticks: old %.2f us, table %.2f us" % (old * 1e6 / repeat, new * 1e6 / repeat)
+
+    # servo.ini, rate limited rudder
+    pwm.loadCalibration(os.path.join(os.path.dirname(__file__), '..', 'servo.ini'))
+    pwm.setServoAngle(6, 0)
+    time.sleep(0.1)
+    pwm.setServoAngle(6, 90)
+    print "rudder 0 -> 90 after 0.1s at 180 deg/s: %.1f deg" % pwm.profile(6, 'angle').last
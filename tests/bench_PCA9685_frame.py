@@ -0,0 +1,72 @@
+#! /usr/bin/python
+""" benchmark PWMFrame on three simulated PCA9685 boards,
+a 50Hz frame of thrusters, rudders and lights where a few channels
+change each frame, written channel by channel with setPWM against
+the diffed block writes of PWMFrame """
+
+import sys
+import os.path
+import time
+import random
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy
+import I2C_sim
+
+sim = I2C_sim.install()
+models = [sim.attach(0x40 + i, I2C_sim.PCA9685Model()) for i in range(3)]
+
+from PCA9685PW import PCA9685PW
+from PCA9685_frame import PWMFrame
+
+
+def frames(count, seed=1):
+    """ thrusters (board 0, channels 0-3) ramp every frame, rudders
+    (board 1, channels 4-5) move now and then, lights (board 2) blink """
+    noise = random.Random(seed)
+    pulses = numpy.full((3, 16), 1500.0)
+    for i in range(count):
+        pulses[0, 0:4] = 1500 + 400 * numpy.sin(i / 50.0 + numpy.arange(4))
+        if noise.random() < 0.2:
+            pulses[1, 4:6] = noise.uniform(1000, 2000)
+        pulses[2, ::3] = 2000 if i // 25 % 2 else 0
+        yield pulses
+
+
+def per_channel(boards, pulses):
+    for index, board in enumerate(boards):
+        for channel in range(16):
+            board.setPWM(channel, 0, int(pulses[index, channel] * board.ticksPerUs))
+
+
+if __name__ == "__main__":
+    boards = [PCA9685PW(0x40 + i, quiet=True) for i in range(3)]
+    for board in boards:
+        board.setPWMFreq(50)
+    count = 500
+
+    print "%-14s %12s %12s %12s" % ("writer", "trans/frame", "bus ms/frame", "cpu us/frame")
+    sim.reset_counters()
+    tic = time.time()
+    for pulses in frames(count):
+        per_channel(boards, pulses)
+    toc = time.time()
+    print "%-14s %12.1f %12.2f %12.1f" % ("setPWM", sim.transactions / float(count),
+                                          sim.bus_time * 1e3 / count, (toc - tic) * 1e6 / count)
+    expected = [[model.channel(c) for c in range(16)] for model in models]
+
+    for max_gap in (0, 1, 3):
+        for board in boards:
+            board.setAllPWM(0, 0)
+        frame = PWMFrame(boards, max_gap=max_gap)
+        sim.reset_counters()
+        tic = time.time()
+        for pulses in frames(count):
+            frame.write(pulses)
+        toc = time.time()
+        assert [[model.channel(c) for c in range(16)] for model in models] == expected
+        print "%-14s %12.1f %12.2f %12.1f" % ("frame gap %d" % max_gap,
+                                              sim.transactions / float(count),
+                                              sim.bus_time * 1e3 / count,
+                                              (toc - tic) * 1e6 / count)
@@ -0,0 +1,71 @@
+#! /usr/bin/python
+""" benchmark the PWM_Driver frame encoders, frames per second of the
+old bitstring path against the struct encoder of frame versions 0
+and 1 (header, sequence and CRC-8), then whole frames sent over the
+simulated bus """
+
+import sys
+import os.path
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import I2C_sim
+from PWM_arduino_I2C import PWM_Driver, crc8
+
+VALUES = (-15, 100)
+
+
+def bitstring_encode(*args):
+    "the old extract_msb_lsb of each value"
+    payload = list()
+    for val in args:
+        val_bitarray = BitArray(int=val, length=16)
+        msb, lsb = val_bitarray.bin[:8], val_bitarray.bin[8:]
+        payload += [int(msb, 2), int(lsb, 2)]
+    return 0, payload
+
+
+def rate(encode, repeat=20000):
+    tic = time.time()
+    for i in xrange(repeat):
+        encode(*VALUES)
+    return repeat / (time.time() - tic)
+
+
+if __name__ == "__main__":
+    sim = I2C_sim.install(busnum=1)
+    model = sim.attach(0x04, I2C_sim.RegisterModel())
+    legacy = PWM_Driver(0x04)
+    framed = PWM_Driver(0x04, version=1)
+
+    encoders = [("struct v0", legacy.encode), ("struct v1+crc", framed.encode)]
+    try:
+        from bitstring import BitArray
+        encoders.insert(0, ("bitstring", bitstring_encode))
+        # same bytes as the old path, over the whole 16 bit range
+        for value in range(-32768, 32768, 7):
+            assert bitstring_encode(value) == legacy.encode(value)
+        for bits in (8, 12):
+            old = lambda v: [int(b, 2) for b in (BitArray(int=v, length=bits).bin[:bits / 2],
+                                                 BitArray(int=v, length=bits).bin[bits / 2:])]
+            narrow = PWM_Driver(0x04, bits=bits)
+            for value in range(-(1 << bits - 1), 1 << bits - 1):
+                assert old(value) == narrow.encode(value)[1]
+    except ImportError:
+        print "bitstring not installed, skipped"
+
+    print "%-14s %12s" % ("encoder", "frames/s")
+    for name, encode in encoders:
+        print "%-14s %12.0f" % (name, rate(encode))
+
+    command, payload = framed.encode(*VALUES)
+    print "v1 frame: %02X %s, crc check %d" % (
+        command, " ".join("%02X" % b for b in payload), crc8([command] + payload))
+
+    sim.reset_counters()
+    tic = time.time()
+    for i in xrange(5000):
+        framed.send_data(*VALUES)
+    print "v1 over the bus: %.0f frames/s, %.2f ms bus time each" % (
+        5000 / (time.time() - tic), sim.bus_time * 1e3 / 5000)
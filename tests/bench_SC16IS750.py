@@ -0,0 +1,167 @@
+#! /usr/bin/python
+""" benchmark SC16IS750.read_sentence on the simulated bus,
+count I2C transactions per sentence and wall time,
+byte-at-a-time reads and writes versus burst block transfers,
+then busy RXLVL polling versus adaptive back-off
+on a 1Hz UART feed in real time,
+and the fix rate of a 10Hz feed at 57600 baud after high_rate,
+its failure on a baud mismatch,
+and stopping the reader on a silent link """
+
+import sys
+import os.path
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import nmea0183
+import I2C_sim
+from SC16IS750_I2C import SC16IS750, GPS_I2C
+
+SENTENCES = [
+    '$GPRMC,081836,A,3751.65,S,14507.36,E,000.0,360.0,130998,011.3,E*62\r\n',
+    '$GPGGA,081836,3751.65,S,14507.36,E,1,08,0.9,10.0,M,0.0,M,,*5A\r\n',
+]
+
+
+def epochs(period, count=600):
+    """ fixed length RMC and GGA of count epochs, period apart """
+    lines = []
+    for index in range(count):
+        stamp = index * period
+        stamp = '%02d%02d%05.2f' % (stamp // 3600 % 24, stamp // 60 % 60, stamp % 60)
+        lines.append(nmea0183.build(
+            'GPRMC,%s,A,3751.65,S,14507.36,E,000.0,360.0,130998,011.3,E' % stamp))
+        lines.append(nmea0183.build(
+            'GPGGA,%s,3751.65,S,14507.36,E,1,08,0.9,10.0,M,0.0,M,,' % stamp))
+    return lines
+
+
+def chip_on(model, cls=SC16IS750, address=0x4d, **kwargs):
+    """ a driver on a fresh simulated bus with model at address """
+    sim = I2C_sim.install(busnum=1)
+    sim.attach(address, model)
+    return cls(address, busnum=1, **kwargs), sim
+
+
+def bench_write(burst, count=2000):
+    chip, sim = chip_on(I2C_sim.SC16IS750Model(SENTENCES), burst=burst)
+    sim.reset_counters()
+    tic = time.time()
+    for i in range(count):
+        chip.write_command('PMTK314,0,1,0,1,1,0,0,0,0,0,0,0,0,0,0,0,0,0,0')
+    toc = time.time()
+    return (sim.transactions * 1.0 / count,
+            sim.bus_time * 1e3 / count,
+            (toc - tic) * 1e6 / count)
+
+
+def bench(burst, count=2000):
+    chip, sim = chip_on(I2C_sim.SC16IS750Model(SENTENCES),
+                        burst=burst, adaptive=False)
+    sim.reset_counters()
+    tic = time.time()
+    for i in range(count):
+        chip.read_sentence()
+    toc = time.time()
+    return (sim.transactions * 1.0 / count,
+            sim.bus_time * 1e3 / count,
+            (toc - tic) * 1e6 / count)
+
+
+if __name__ == "__main__":
+    print "%-8s %14s %14s %14s" % ("mode", "trans/sent", "bus ms/sent", "cpu us/sent")
+    for burst in (False, True):
+        result = bench(burst)
+        print "%-8s %14.1f %14.2f %14.1f" % (("burst" if burst else "byte",) + result)
+
+    print
+    print "%-8s %14s %14s %14s" % ("write", "trans/sent", "bus ms/sent", "cpu us/sent")
+    for burst in (False, True):
+        result = bench_write(burst)
+        print "%-8s %14.1f %14.2f %14.1f" % (("burst" if burst else "byte",) + result)
+
+    # back to back sentences, FIFO reads cross sentence boundaries
+    chip, sim = chip_on(I2C_sim.SC16IS750Model(SENTENCES, gap=False))
+    merged = 0
+    for i in range(2000):
+        if chip.read_sentence().count('$') != 1:
+            merged += 1
+    print "merged sentences without gap: %d / 2000" % merged
+
+    # real time feed, 2 sentences per second
+    print
+    print "%-8s %10s %10s %10s %10s %10s" % \
+        ("poll", "sentences", "polls/s", "trans/s", "cpu %", "overflow")
+    for adaptive in (False, True):
+        model = I2C_sim.SC16IS750Model(epochs(1.0), realtime=True)
+        chip, sim = chip_on(model, adaptive=adaptive)
+        sim.reset_counters()
+        count = 0
+        tic, cpu = time.time(), time.clock()
+        while time.time() - tic < 3.0:
+            chip.read_sentence()
+            count += 1
+        wall, cpu = time.time() - tic, time.clock() - cpu
+        print "%-8s %10d %10.0f %10.0f %10.1f %10d" % \
+            ("adaptive" if adaptive else "busy", count, model.polls / wall,
+             sim.transactions / wall, 100 * cpu / wall, model.overflow)
+
+    # a module at 4800 baud does not hear PMTK251 sent at 9600,
+    # high_rate finds no answer at 57600 and goes back to 9600
+    print
+    model = I2C_sim.SC16IS750Model(epochs(0.1), baud=4800, realtime=True)
+    gps, sim = chip_on(model, GPS_I2C, 0x48, sentences=('RMC', 'GGA'))
+    assert not gps.verify_link(0.5)
+    try:
+        gps.high_rate(10, 57600)
+    except IOError as error:
+        print "baud mismatch: %s, back at %d" % (error, gps.baud)
+    else:
+        raise AssertionError("high_rate succeeded on a baud mismatch")
+    assert gps.baud == 9600 and model.gps_baud == 4800 and not model.sent
+
+    # switched from 1Hz at 9600 to 10Hz at 57600 by high_rate,
+    # RMC+GGA through the background reader
+    model = I2C_sim.SC16IS750Model(epochs(0.1), realtime=True)
+    gps, sim = chip_on(model, GPS_I2C, 0x48, sentences=('RMC', 'GGA'))
+    assert gps.verify_link()
+    gps.high_rate(10, 57600)
+    assert gps.baud == model.gps_baud == 57600 and model.baud_matches()
+    assert model.sent[-3:][0].startswith('$PMTK251,57600') and \
+        model.sent[-1].startswith('$PMTK220,100')
+    print "high_rate: bridge at %.0f baud, module at %d, %s" % (
+        model.bridge_baud(), model.gps_baud, " ".join(line[:10] for line in model.sent))
+    gps.start_reader()
+    time.sleep(3.0)
+    stats = gps.link_stats()
+    gps.stop_reader()
+    print "10Hz at 57600: %(fixes_per_second).1f fixes/s, %(rejected)d rejected, " \
+        "%(incomplete)d incomplete, %(missed)d missed" % stats, \
+        "overflow %d" % model.overflow
+
+    # a silent link, the reader stops within READ_TIMEOUT
+    gps, sim = chip_on(I2C_sim.SC16IS750Model(realtime=True), GPS_I2C, 0x48)
+    gps.stop_reader()
+    gps.start_reader()
+    time.sleep(0.2)
+    tic = time.time()
+    gps.stop_reader()
+    spent = time.time() - tic
+    assert gps.reader is None and spent < 2 * gps.READ_TIMEOUT
+    gps.stop_reader()
+    # one reader per FIFO, also while a timed out stop is still pending
+    gps.start_reader()
+    for stop in (None, 0):
+        try:
+            gps.start_reader()
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("a second reader started")
+        if stop is not None:
+            gps.stop_reader(stop)
+    assert gps.reader is not None
+    gps.stop_reader()
+    assert gps.reader is None
+    print "stop_reader on a silent link: %.0f ms" % (spent * 1e3)
@@ -0,0 +1,61 @@
+#! /usr/bin/python
+""" benchmark the byte order helpers of Adafruit_I2C,
+reverseByteOrder against the old hex() slicing loop,
+and a 6-axis sample (accel + gyro x, y, z) read as six readS16
+against one readArray block read on the simulated bus """
+
+import sys
+import os.path
+import time
+import struct
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import I2C_sim
+from Adafruit_I2C import Adafruit_I2C
+
+# big endian x, y, z of accel and gyro from register 0x3B (MPU-6050 layout)
+SAMPLE_REG = 0x3B
+SAMPLE = (-16384, 12, 8191, -1, 32767, -32768)
+
+
+def old_reverseByteOrder(data):
+    "the old reverseByteOrder"
+    byteCount = len(hex(data)[2:].replace('L', '')[::2])
+    val = 0
+    for i in range(byteCount):
+        val = (val << 8) | (data & 0xff)
+        data >>= 8
+    return val
+
+
+def timeit(func, repeat=20000):
+    tic = time.time()
+    for i in range(repeat):
+        func()
+    return (time.time() - tic) * 1e6 / repeat
+
+
+if __name__ == "__main__":
+    sim = I2C_sim.install(busnum=1)
+    model = sim.attach(0x68, I2C_sim.RegisterModel())
+    model.write_block(SAMPLE_REG, bytearray(struct.pack('>6h', *SAMPLE)))
+    imu = Adafruit_I2C(0x68, busnum=1)
+
+    for value in (0, 0x12, 0x1234, 0x123456, 0x12345678, 0xDEADBEEFL, 0x123456789AL):
+        assert imu.reverseByteOrder(value) == old_reverseByteOrder(value), hex(value)
+    print "reverseByteOrder: old %.2f us, new %.2f us" % (
+        timeit(lambda: old_reverseByteOrder(0x12345678)),
+        timeit(lambda: imu.reverseByteOrder(0x12345678)))
+
+    regs = range(SAMPLE_REG, SAMPLE_REG + 12, 2)
+    assert [imu.readS16(reg, False) for reg in regs] == list(SAMPLE)
+    assert list(imu.readArray(SAMPLE_REG, 6, 'h', little_endian=False)) == list(SAMPLE)
+
+    print "%-22s %8s %10s" % ("6-axis sample", "trans", "us")
+    for name, read in (
+            ("readS16 x6", lambda: [imu.readS16(reg, False) for reg in regs]),
+            ("readArray", lambda: imu.readArray(SAMPLE_REG, 6, 'h', False))):
+        sim.reset_counters()
+        per_sample = timeit(read, 5000)
+        print "%-22s %8.0f %10.1f" % (name, sim.transactions / 5000.0, per_sample)
@@ -0,0 +1,138 @@
+#! /usr/bin/python
+""" fault injection on the simulated bus,
+GPS sentences read through random NACKs with and without retries,
+and through late faults, where the failed FIFO read had already
+popped its bytes, every sentence read checked against the feed,
+also with raiseErrors off,
+GPS commands written through late faults, checked as received,
+a stuck bus that reopening the handle does not bring back,
+and a PCA9685 frequency change failing cleanly instead of
+writing a -1 prescale """
+
+import sys
+import os.path
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import I2C_sim
+from Adafruit_I2C import Adafruit_I2C, I2CError, RetryPolicy
+from SC16IS750_I2C import GPS_I2C
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'nmea_sample.nmea')
+
+
+def read_through_faults(rate, attempts, late=False, count=2000):
+    """ (fixes, surfaced errors, retries, sentences not in the feed,
+    us/sentence) of count sentences read with transactions failing
+    at rate """
+    sim = I2C_sim.install(busnum=1)
+    sim.attach(0x48, I2C_sim.SC16IS750Model(CORPUS))
+    feed = set(line.rstrip('\r\n') + '\r\n' for line in open(CORPUS))
+    stats = Adafruit_I2C.enableStats(1)
+    gps = GPS_I2C(0x48, busnum=1, sentences=('RMC', 'GGA'), adaptive=False)
+    gps.retryPolicy = RetryPolicy(attempts, delay=0.0)
+    sim.fail_rate(rate, seed=1, late=late)
+    fixes = errors = sentences = bad = 0
+    tic = time.time()
+    while sentences < count:
+        try:
+            sentence = gps.read_sentence()
+        except I2CError:
+            # complete lines stay in the assembler, a line that lost
+            # bytes is dropped
+            errors += 1
+            continue
+        sentences += 1
+        if sentence not in feed:
+            bad += 1
+        if gps.parse_fix(sentence) is not None:
+            fixes += 1
+    toc = time.time()
+    retries = sum(entry[3] for entry in stats.snapshot().values())
+    return fixes, errors, retries, bad, (toc - tic) * 1e6 / count
+
+
+def write_through_faults(rate, count=500):
+    """ (commands written, I2CErrors, commands received garbled) """
+    sim = I2C_sim.install(busnum=1)
+    model = sim.attach(0x48, I2C_sim.SC16IS750Model(CORPUS))
+    gps = GPS_I2C(0x48, busnum=1)
+    gps.retryPolicy = RetryPolicy(delay=0.0)
+    sim.fail_rate(rate, seed=2, late=True)
+    written = set()
+    errors = 0
+    for i in range(count):
+        try:
+            # longer than one 32 byte block
+            written.add(gps.write_command('PMTK314,0,1,0,1,0,0,0,0,0,0,0,0,0,0,0,0,0,%d,0' % i).rstrip('\r\n'))
+        except I2CError:
+            errors += 1
+    sim.fail_rate(0)
+    # a broken line ends up empty or as a fragment, never doubled up
+    garbled = [line for line in model.sent if line and line not in written]
+    assert all(not line.startswith('$') or line.count('$') == 1 for line in garbled)
+    received = [line for line in model.sent if line in written]
+    assert len(received) == len(set(received)) == len(written)
+    return count - errors, errors, len(garbled)
+
+
+if __name__ == "__main__":
+    print "%-10s %9s %8s %8s %8s %8s %12s" % ("rate", "attempts", "fixes", "errors",
+                                              "retries", "bad", "us/sentence")
+    for late in (False, True):
+        for rate in (0.001, 0.01, 0.05):
+            for attempts in (1, 3):
+                print "%-10s %9d %8d %8d %8d %8d %12.1f" % (
+                    ("%.3f%s" % (rate, " late" if late else ""), attempts) +
+                    read_through_faults(rate, attempts, late))
+
+    # raiseErrors off, failed reads print and return -1 instead of
+    # raising, the broken lines are dropped all the same
+    Adafruit_I2C.raiseErrors = False
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        result = read_through_faults(0.05, 1, True)
+    finally:
+        sys.stdout = stdout
+        Adafruit_I2C.raiseErrors = True
+    assert result[1] == 0 and result[3] == 0
+    print "%-10s %9d %8d %8d %8d %8d %12.1f" % (("0.050 -1", 1) + result)
+
+    print
+    for rate in (0.01, 0.05):
+        print "commands at %.2f late faults: %d written, %d I2CError, %d garbled received" % (
+            (rate,) + write_through_faults(rate))
+
+    # a slave holding SDA, every transaction fails, a reopened
+    # handle does not help, only freeing the slave does
+    print
+    sim = I2C_sim.install(busnum=1)
+    sim.attach(0x20, I2C_sim.RegisterModel())
+    device = Adafruit_I2C(0x20, busnum=1)
+    device.write8(0x05, 0x42)
+    sim.stick()
+    try:
+        device.readU8(0x05)
+    except I2CError, err:
+        print "stuck bus: I2CError after %d reopen:" % device.bus.reopens, err
+    else:
+        raise AssertionError("a reopen freed a stuck bus")
+    sim.unstick()
+    print "slave freed: read 0x%02X" % device.readU8(0x05)
+
+    # the MODE1 read of setPWMFreq fails on every attempt
+    print
+    sim = I2C_sim.install()
+    model = sim.attach(0x40, I2C_sim.PCA9685Model())
+    from PCA9685PW import PCA9685PW
+    pwm = PCA9685PW(0x40, quiet=True)
+    pwm.initialize()
+    pwm.i2c.retryPolicy = RetryPolicy(delay=0.0, reopen=False)
+    sim.fail_next(3, 0x40)
+    try:
+        pwm.setPWMFreq(50)
+    except I2CError, err:
+        print "setPWMFreq: I2CError", err
+    print "PRESCALE 0x%02X, MODE1 0x%02X" % (model.regs[model.PRESCALE],
+                                            model.regs[model.MODE1])
@@ -0,0 +1,99 @@
+#! /usr/bin/python
+""" benchmark nmea0183.parse against pynmea2 over a recorded corpus,
+the pynmea2 path is the old GPS_I2C.parse_sentence: parse every line,
+drop the unwanted types, then build the fix dict """
+
+import sys
+import os.path
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import nmea0183
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'nmea_sample.nmea')
+TYPES = nmea0183.GPS_TYPES + nmea0183.WX200_TYPES
+
+
+def pynmea2_fix(parsed):
+    """ fix dict as the old parse_sentence built it """
+    return {"latitude": parsed.latitude,
+            "longitude": parsed.longitude,
+            "lat_dir": parsed.lat_dir,
+            "lon_dir": parsed.lon_dir,
+            "datetime": parsed.datestamp.strftime("%Y-%m-%d ") +
+            parsed.timestamp.strftime("%H:%M:%S"),
+            "spd_over_grnd": parsed.spd_over_grnd,
+            "true_course": parsed.true_course,
+            "fix": parsed.is_valid}
+
+
+def run_pynmea2(lines):
+    count = 0
+    for line in lines:
+        try:
+            parsed = pynmea2.parse(line, check=True)
+        except Exception:
+            continue
+        sentence_type = getattr(parsed, 'sentence_type', None)
+        if sentence_type == 'RMC':
+            pynmea2_fix(parsed)
+            count += 1
+        elif sentence_type in TYPES:
+            count += 1
+    return count
+
+
+def run_fast(lines):
+    count = 0
+    for line in lines:
+        if nmea0183.parse(line, TYPES) is not None:
+            count += 1
+    return count
+
+
+def timeit(func, lines, repeat=20):
+    tic = time.time()
+    for i in range(repeat):
+        count = func(lines)
+    return count, (time.time() - tic) / (repeat * len(lines))
+
+
+if __name__ == "__main__":
+    lines = open(CORPUS).readlines()
+    print "corpus: %d lines, parsing %s" % (len(lines), ",".join(TYPES))
+    print "%-10s %10s %12s %12s" % ("parser", "parsed", "us/line", "lines/s")
+    results = [("nmea0183", run_fast)]
+    try:
+        import pynmea2
+        results.insert(0, ("pynmea2", run_pynmea2))
+    except ImportError:
+        print "pynmea2 not installed, skipped"
+    for name, func in results:
+        count, per_line = timeit(func, lines)
+        print "%-10s %10d %12.1f %12.0f" % (name, count, per_line * 1e6, 1 / per_line)
+
+    # talkers are filtered next to the type, before the checksum
+    gn = [nmea0183.build('GN' + line[3:line.rfind('*')])
+          for line in lines if line.startswith('$GPRMC')]
+    assert all(nmea0183.parse(line, ('RMC',)) for line in gn)
+    assert not any(nmea0183.parse(line, ('RMC',), talkers=('GP',)) for line in gn)
+    assert all(nmea0183.parse(line, ('RMC',), talkers=('GP',)) == nmea0183.parse(line, ('RMC',))
+               for line in lines)
+    print "talkers=('GP',): %d GNRMC dropped, %.1f us/line" % (
+        len(gn), timeit(lambda lines: [nmea0183.parse(line, ('RMC',), talkers=('GP',))
+                                       for line in lines], gn)[1] * 1e6)
+
+    # both paths must agree on the fixes
+    if len(results) == 2:
+        for line in lines:
+            fast = nmea0183.parse(line, ('RMC',))
+            if fast is None:
+                continue
+            slow = pynmea2_fix(pynmea2.parse(line))
+            for key, value in slow.items():
+                if isinstance(value, float):
+                    assert abs(value - fast[key]) < 1e-9, (key, line)
+                else:
+                    assert value == fast[key], (key, line)
+        print "RMC fixes identical"
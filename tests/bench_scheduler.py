@@ -0,0 +1,59 @@
+#! /usr/bin/python
+""" benchmark the I2CScheduler on the simulated bus, three LCD threads
+writing flat out and a rudder write every 2 ms, where every transaction
+takes 0.5 ms, the rudder write latency unscheduled against scheduled
+with the rudder first, every transaction counted in the report """
+
+import sys
+import os.path
+import time
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import I2C_sim
+from Adafruit_I2C import Adafruit_I2C
+from I2C_scheduler import I2CScheduler, ACTUATOR, LCD
+
+
+if __name__ == "__main__":
+    for scheduled in (False, True):
+        sim = I2C_sim.install(latency=0.0005, busnum=1)
+        sim.attach(0x3f, I2C_sim.RegisterModel())
+        sim.attach(0x40, I2C_sim.RegisterModel())
+        lcd = Adafruit_I2C(0x3f, busnum=1)
+        rudder = Adafruit_I2C(0x40, busnum=1)
+        scheduler = I2CScheduler()
+        if scheduled:
+            scheduler.attach(rudder, ACTUATOR, deadline=0.002, name="rudder")
+            scheduler.attach(lcd, LCD, name="lcd")
+            scheduler.set_budget("lcd", 0.5)
+        stop = threading.Event()
+        writes = [0] * 3
+
+        def lcd_loop(index):
+            while not stop.is_set():
+                lcd.writeRaw8(0x08)
+                writes[index] += 1
+
+        threads = [threading.Thread(target=lcd_loop, args=(i,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        latency = []
+        for i in range(500):
+            tic = time.time()
+            rudder.write8(0x06, 0)
+            latency.append(time.time() - tic)
+            time.sleep(0.002)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        latency.sort()
+        print "%s: rudder write mean %.2f ms, 95%% %.2f ms" % (
+            "scheduled" if scheduled else "unscheduled",
+            1e3 * sum(latency) / len(latency), 1e3 * latency[len(latency) * 95 / 100])
+        if scheduled:
+            # every transaction of the three LCD threads is counted
+            assert scheduler.devices["lcd"].count == sum(writes)
+            assert scheduler.devices["rudder"].count == 500
+            print scheduler.report()
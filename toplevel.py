@@ -16,6 +16,9 @@ import I2C.LCD_I2C as LCD
 # import GPS.waypoint as waypoint
 import PWM.PCA9685PW as PWM
 import NMEA.file_IO as FLE
+from I2C.Adafruit_I2C import Adafruit_I2C
+import signal
+import sys
 import time
 
 
@@ -34,14 +37,32 @@ def log_data(filename, *args):
         except KeyboardInterrupt:
             _lf.close()  # close file
 
+# I2C transaction stats of each bus from when a device opens it,
+# dumped to stderr by the loop after kill -USR1 <pid>, the handler only
+# sets a flag, it may interrupt the main thread holding a lock (the bus
+# registry, or an Event's) and must not take one itself
+Adafruit_I2C.statsOnOpen = True
+dump_stats = [False]
+
+
+def request_stats(signum, frame):
+    dump_stats[0] = True
+
+signal.signal(signal.SIGUSR1, request_stats)
+
 # GPS from GPS
 GPS = GPS.GPS_I2C(0x48, output_data="RMCONLY", quiet=True)
 GPS.GPS_initialize()
+GPS.start_reader()
 IMU = RTIMU.alti_IMU(quiet=True)
 IMU.initialize()
+# fusion runs on its own thread at the IMU poll interval
+IMU.start_stream()
 LCD = LCD.LCD_I2C(0x3f)
 LCD.initialize()
-PWM = PWM.PCA9685PW(0x40, quiet=False)
+# redrawn by its own thread, the loop only updates the frame
+LCD.start_refresher(rate=2)
+PWM = PWM.PCA9685PW(0x40, quiet=False, calibration='servo.ini')
 PWM.setPWMFreq(50) # Set frequency to 50 Hz
 
 # destination
@@ -50,13 +71,43 @@ destination = (40.6, -73.8)
 # define filename
 filename = 'GPS_IMU.log'
 
+# loop period (s), no longer paced by a blocking IMU read
+period = 0.5
+# an attitude older than this (s) is not used, the stream has stalled
+IMU_max_age = 0.2
+# a fix older than three GPS epochs (s) is not used, the reader has stalled
+GPS_max_age = 3.0 / GPS.update_rate
+
 try:
+    # newest fix from the GPS reader thread, GPS_age is its staleness
+    GPS_data, GPS_age = GPS.wait_fix()
+    IMU_data, IMU_age = IMU.wait_sample()
+    deadline = time.time()
     while True:
+        if dump_stats[0]:
+            dump_stats[0] = False
+            sys.stderr.write(Adafruit_I2C.statsReport() + '\n')
         # tic = time.time()
-        GPS_data = GPS.parse_sentence()
+        GPS_data, GPS_age = GPS.latest_fix()
         # toc = time.time()
         # print toc-tic
-        IMU_data = IMU.read_data(tid=2)
+        if GPS_age > GPS_max_age:
+            # the position before the stall, not the position now
+            print("GPS fix %.1fs old, %d I2C errors, skipped" % \
+                    (GPS_age, GPS.stats["i2c_errors"]))
+            LCD.set_line("GPS stale %.0fs" % GPS_age, 2)
+            deadline += period
+            time.sleep(max(deadline - time.time(), 0))
+            continue
+        IMU_data, IMU_age = IMU.latest()
+        if IMU_age > IMU_max_age:
+            # the last sample before the stall, not the attitude now
+            print("IMU sample %.2fs old, %d read errors, skipped" % \
+                    (IMU_age, IMU.stats["errors"]))
+            LCD.set_line("IMU stale %.1fs" % IMU_age, 3)
+            deadline += period
+            time.sleep(max(deadline - time.time(), 0))
+            continue
         print("tid: %s r: %.1f p: %.1f y: %.1f, lat: %.6f, lon: %.6f" % \
                 (GPS_data["datetime"], IMU_data["roll"], IMU_data['pitch'], IMU_data['yaw'], \
                 GPS_data["latitude"], GPS_data["longitude"]))
@@ -65,9 +116,16 @@ try:
         dist = result['s12']
         azi1 = result['azi1']
         bearing = IMU_data['yaw']-azi1
-        LCD.send_string("%s" % GPS_data["datetime"], 1)
-        LCD.send_string("%.4f%s,%.4f%s" % (GPS_data["latitude"], GPS_data["lat_dir"], GPS_data["longitude"], GPS_data["lon_dir"]), 2)
-        LCD.send_string("p:%.1f,r:%.1f,y:%.1f" % (IMU_data["pitch"], IMU_data['roll'], IMU_data['yaw']), 3)
-        LCD.send_string("%.1f,%.1f"%(dist,bearing), 4)
+        LCD.set_line("%s" % GPS_data["datetime"], 1)
+        LCD.set_line("%.4f%s,%.4f%s" % (GPS_data["latitude"], GPS_data["lat_dir"], GPS_data["longitude"], GPS_data["lon_dir"]), 2)
+        LCD.set_line("p:%.1f,r:%.1f,y:%.1f" % (IMU_data["pitch"], IMU_data['roll'], IMU_data['yaw']), 3)
+        # arrow towards the destination, straight up is ahead,
+        # its glyph is uploaded by the refresher, no bus I/O here
+        LCD.set_line("%.1f,%.1f %s"%(dist,bearing,LCD.bearing_arrow(-bearing)), 4)
+        deadline += period
+        time.sleep(max(deadline - time.time(), 0))
 except KeyboardInterrupt:
+    GPS.stop_reader()
+    IMU.stop_stream()
+    LCD.stop_refresher()
     LCD.clear_screen()
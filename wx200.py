@@ -1,6 +1,6 @@
 import time
 import serial
-import pynmea2
+import nmea0183
 from SC16IS750_I2C import *
 
 
@@ -40,6 +40,7 @@ class WX200(WX200_UART, SC16IS750):
             port=None, parity='N', stopbits=1, bytesize=8, timeout=5, config='UART'):
         """ both uart and I2c interface, uart has higher piority """
         self.config = config
+        self.timeout = timeout
         if port is None: # no UART connection
             self.config = 'I2C'
         elif address is None: # no I2C address
@@ -58,6 +59,26 @@ class WX200(WX200_UART, SC16IS750):
         else:
             return WX200_UART.__str__(self)
 
+    def read_line(self):
+        """ next sentence, '' or None if nothing arrives within timeout """
+        if self.config is 'I2C':
+            return SC16IS750.read_sentence(self, self.timeout)
+        else:
+            return self.conn.readline()
+
+    def parse_sentence(self, types=nmea0183.WX200_TYPES, talkers=None):
+        """ parse the next MWV, MDA or HDG sentence into a dict,
+        see nmea0183.FIELDS for the keys, of talkers only (e.g. ('WI',))
+        if given, None if the station sends nothing within timeout """
+        data = None
+        while data is None:
+            sentence = self.read_line()
+            if not sentence:
+                # timeout, the station is off or disconnected
+                return None
+            data = nmea0183.parse(sentence, types, talkers=talkers)
+        return data
+
 if __name__ == "__main__":
     WX200 = WX200(port="/dev/ttyAMA0", baud=4800) #, config='UART')
     # WX200 = WX200(address=0x4d, baud = 4800, config ='I2C')